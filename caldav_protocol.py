@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+CalDAV 协议辅助模块
+提供 sync-collection (RFC 6578) 与 calendar-multiget 请求体的构造，以及 multistatus 响应的（流式）解析
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from urllib.parse import unquote, urljoin, urlsplit
+from xml.sax.saxutils import escape
+
+NAMESPACES = {
+    'D': 'DAV:',
+    'C': 'urn:ietf:params:xml:ns:caldav',
+    'CS': 'http://calendarserver.org/ns/'
+}
+
+def build_sync_collection_body(sync_token: Optional[str]) -> str:
+    """构造 sync-collection REPORT 请求体，只请求 ETag，事件内容由 calendar-multiget 获取"""
+
+    return f'''<?xml version="1.0" encoding="utf-8" ?>
+<D:sync-collection xmlns:D="DAV:">
+    <D:sync-token>{escape(sync_token or '')}</D:sync-token>
+    <D:sync-level>1</D:sync-level>
+    <D:prop>
+        <D:getetag />
+    </D:prop>
+</D:sync-collection>'''
+
+def build_multiget_body(hrefs: List[str]) -> str:
+    """构造 calendar-multiget REPORT 请求体"""
+
+    href_lines = "\n".join(f"    <D:href>{escape(href)}</D:href>" for href in hrefs)
+
+    return f'''<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+    <D:prop>
+        <D:getetag />
+        <C:calendar-data />
+    </D:prop>
+{href_lines}
+</C:calendar-multiget>'''
+
+# 集合主目录（home set）的版本标识，用于校验缓存的集合列表是否仍然有效
+HOME_VALIDATOR_BODY = '''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:" xmlns:CS="http://calendarserver.org/ns/">
+    <D:prop>
+        <CS:getctag />
+        <D:getetag />
+        <D:sync-token />
+    </D:prop>
+</D:propfind>'''
+
+def parse_home_validator(xml_data: str, base_url: str) -> Optional[Dict]:
+    """从 PROPFIND 响应中提取 base_url 自身的 ctag / ETag / sync-token
+
+    服务器没有为 base_url 返回任何版本标识时返回 None（无法校验缓存）。
+    """
+
+    root = ET.fromstring(xml_data)
+    base_path = unquote(urlsplit(base_url).path).rstrip('/')
+
+    for response_elem in root.findall('D:response', NAMESPACES):
+        href = response_elem.findtext('D:href', namespaces=NAMESPACES)
+        if not href or unquote(urlsplit(urljoin(base_url, href.strip())).path).rstrip('/') != base_path:
+            continue
+
+        validator = {
+            'ctag': response_elem.findtext('.//CS:getctag', namespaces=NAMESPACES),
+            'etag': response_elem.findtext('.//D:getetag', namespaces=NAMESPACES),
+            'sync_token': response_elem.findtext('.//D:sync-token', namespaces=NAMESPACES)
+        }
+        return validator if any(validator.values()) else None
+
+    return None
+
+def home_validator_matches(cached: Optional[Dict], current: Optional[Dict]) -> bool:
+    """比较两次获取的主目录版本标识：双方都提供的标识必须全部一致，且至少有一项可比较"""
+
+    if not cached or not current:
+        return False
+    shared = [key for key in ('ctag', 'etag', 'sync_token') if cached.get(key) and current.get(key)]
+    return bool(shared) and all(cached[key] == current[key] for key in shared)
+
+def _status_code(status_text: Optional[str]) -> int:
+    """从 'HTTP/1.1 200 OK' 形式的状态行中提取状态码"""
+
+    if not status_text:
+        return 0
+    parts = status_text.split()
+    if len(parts) >= 2 and parts[1].isdigit():
+        return int(parts[1])
+    return 0
+
+def parse_sync_collection(xml_data: str) -> Dict:
+    """解析 sync-collection 响应
+
+    返回字典:
+        changed: [(href, etag), ...]  新增或修改的资源
+        deleted: [href, ...]          已删除的资源
+        sync_token: 新的同步令牌
+        truncated: 结果是否被服务器截断 (507)，需要用新令牌继续请求
+    """
+
+    root = ET.fromstring(xml_data)
+    changed = []
+    deleted = []
+    truncated = False
+
+    for response_elem in root.findall('D:response', NAMESPACES):
+        href_elem = response_elem.find('D:href', NAMESPACES)
+        if href_elem is None or not href_elem.text:
+            continue
+        href = href_elem.text.strip()
+
+        # 资源级状态：404 表示已删除，507 表示结果被截断
+        status_code = _status_code(response_elem.findtext('D:status', namespaces=NAMESPACES))
+        if status_code == 404:
+            deleted.append(href)
+            continue
+        if status_code == 507:
+            truncated = True
+            continue
+
+        # 集合自身不是事件资源
+        if href.endswith('/'):
+            continue
+
+        for propstat in response_elem.findall('D:propstat', NAMESPACES):
+            if _status_code(propstat.findtext('D:status', namespaces=NAMESPACES)) != 200:
+                continue
+            etag = propstat.findtext('D:prop/D:getetag', namespaces=NAMESPACES)
+            changed.append((href, etag))
+            break
+
+    return {
+        'changed': changed,
+        'deleted': deleted,
+        'sync_token': root.findtext('D:sync-token', namespaces=NAMESPACES),
+        'truncated': truncated
+    }
+
+def is_invalid_sync_token(status_code: int, body: str) -> bool:
+    """判断 sync-collection 是否因同步令牌失效而被拒绝（RFC 6578 valid-sync-token 前置条件）"""
+    return status_code in (403, 409, 410) and ('valid-sync-token' in body or status_code == 410)
+
+# 流式读取响应体时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class ResponseTooLargeError(Exception):
+    """响应体超过允许的大小"""
+
+def limit_stream(chunks: Iterable[bytes], max_bytes: int) -> Iterator[bytes]:
+    """原样产出数据块，累计大小超过 max_bytes 时抛出 ResponseTooLargeError（max_bytes <= 0 时不限制）"""
+
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        if 0 < max_bytes < total:
+            raise ResponseTooLargeError(f"响应超过 {max_bytes} 字节")
+        yield chunk
+
+def save_stream(chunks: Iterable[bytes], filepath: str) -> Iterator[bytes]:
+    """边读取边把响应体写入文件（用于调试留档），原样产出每个数据块"""
+
+    with open(filepath, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+
+def read_file_chunks(filepath: str) -> Iterator[bytes]:
+    """按 STREAM_CHUNK_SIZE 分块读取已落盘的响应体"""
+
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            yield chunk
+
+def iter_multistatus_responses(source: Union[str, bytes, Iterable[bytes]]) -> Iterator[Dict]:
+    """增量解析 multistatus 响应，逐个产出资源
+
+    source 可以是完整的 XML 文本，也可以是响应体的数据块迭代器。
+    每个 D:response 解析完成后立即产出并从树中移除，内存占用与响应大小无关。
+    产出字典: href, etag, calendar_data（不存在时为 None）
+    """
+
+    if isinstance(source, str):
+        source = [source.encode('utf-8')]
+    elif isinstance(source, bytes):
+        source = [source]
+
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    response_tag = f"{{{NAMESPACES['D']}}}response"
+    root = None
+
+    def drain():
+        nonlocal root
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+
+            if elem.tag != response_tag:
+                continue
+
+            href = elem.findtext('D:href', namespaces=NAMESPACES)
+            yield {
+                'href': href.strip() if href else '',
+                'etag': elem.findtext('.//D:getetag', namespaces=NAMESPACES),
+                'calendar_data': elem.findtext('.//C:calendar-data', namespaces=NAMESPACES)
+            }
+
+            # 释放已处理的节点
+            elem.clear()
+            if root is not None:
+                try:
+                    root.remove(elem)
+                except ValueError:
+                    pass
+
+    for chunk in source:
+        if chunk:
+            parser.feed(chunk)
+            yield from drain()
+
+    parser.close()
+    yield from drain()
@@ -0,0 +1,1000 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+通用 CalDAV 同步引擎
+集合发现、ctag 跳过、增量同步、流式下载和事件存储等逻辑只在此实现一次，
+各服务的差异（URL、超时、PROPFIND 属性等）由 providers.py 中注册的子类覆盖
+"""
+
+from requests.auth import HTTPBasicAuth
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from urllib.parse import urljoin
+from caldav_protocol import (
+    STREAM_CHUNK_SIZE, ResponseTooLargeError, build_multiget_body, build_sync_collection_body,
+    HOME_VALIDATOR_BODY, home_validator_matches, is_invalid_sync_token, iter_multistatus_responses, limit_stream, parse_home_validator,
+    parse_sync_collection, read_file_chunks, save_stream
+)
+from config_manager import CalDAVAccount, config_flag
+from console import map_buffered
+from event_record import EventRecord, format_timestamp
+from event_store import EventStore
+from http_client import get_circuit_breaker, get_session, is_timeout_error, request_with_retry, resolve_timeout
+from ics_merger import ICSMerger
+from providers import get_provider_label
+from sync_state import SyncStateStore
+
+# 集合显示名称中不能用于目录名的字符
+_UNSAFE_PATH_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+class CalDAVSync:
+    """通用 CalDAV 同步处理器
+
+    子类可覆盖的类属性:
+        service: 服务标识，用于事件目录、临时文件和状态文件的命名，默认取账号类型
+        label: 日志中显示的服务名称，默认取注册表中的名称
+        default_timeout: 未配置 TIMEOUT 时的读取超时（秒）
+        extra_props: 集合发现时额外请求的 PROPFIND 属性
+    """
+
+    service = None
+    label = None
+    default_timeout = 30
+    extra_props = ()
+
+    def __init__(self, account: CalDAVAccount, config: dict = None):
+        self.account = account
+        self.service = self.service or account.account_type
+        self.label = self.label or get_provider_label(self.service)
+        self.base_url = account.get_formatted_url()
+        self.username = account.username
+        self.password = account.password
+        self.output_dir = f"{self.service}_events_{self.username}"
+        self.merger = ICSMerger()
+
+        # 从配置中获取时间范围（{SERVICE}_SYNC_DAYS_PAST / _FUTURE），提供默认值
+        config = config or {}
+        prefix = self.service.upper()
+        self.sync_days_past = int(config.get(f'{prefix}_SYNC_DAYS_PAST') or 90)
+        self.sync_days_future = int(config.get(f'{prefix}_SYNC_DAYS_FUTURE') or 90)
+
+        # 共享的连接池会话与超时配置
+        self.session = get_session(pool_maxsize=config.get('HTTP_POOL_MAXSIZE'))
+        self.timeout = resolve_timeout(config, default_read_timeout=self.default_timeout)
+        self.auth = HTTPBasicAuth(self.username, self.password)
+
+        # 请求重试（指数退避 + 抖动）与按服务共享的熔断器
+        self.max_retries = int(config.get('HTTP_MAX_RETRIES') or 2)
+        self.backoff_base = float(config.get('HTTP_BACKOFF_BASE') or 1)
+        self.backoff_max = float(config.get('HTTP_BACKOFF_MAX') or 30)
+        self.breaker = get_circuit_breaker(
+            self.service,
+            failure_threshold=config.get('CIRCUIT_FAILURE_THRESHOLD'),
+            reset_timeout=config.get('CIRCUIT_RESET_SECONDS')
+        )
+        # 由同步流水线设置：多个处理器共享的请求槽（限制同时进行的请求数），
+        # 以及是否先把时间范围响应完整落盘、释放请求槽后再解析
+        self.request_slots = None
+        self.spool_responses = False
+
+        # 集合同步状态（ctag / sync-token），用于跳过未变化的集合
+        self.state_store = SyncStateStore(self.service, self.username)
+        self.ctag_max_age = float(config.get('CTAG_MAX_AGE_HOURS') or 24) * 3600
+
+        # 增量同步（RFC 6578 sync-collection），服务器不支持或令牌失效时回退到按时间范围下载
+        self.delta_sync = config_flag(config.get('DELTA_SYNC'))
+        self.multiget_batch_size = int(config.get('MAX_EVENTS_PER_REQUEST') or 50)
+
+        # 分层时间窗口：近期的热窗口每次刷新，完整窗口每隔 COLD_REFRESH_HOURS 刷新一次
+        self.hot_days_past = int(config.get('HOT_DAYS_PAST') or 1)
+        self.hot_days_future = int(config.get('HOT_DAYS_FUTURE') or 14)
+        self.cold_refresh = float(config.get('COLD_REFRESH_HOURS') or 24) * 3600
+        self.tiered_sync = (
+            config_flag(config.get('TIERED_SYNC'))
+            and (self.hot_days_past < self.sync_days_past or self.hot_days_future < self.sync_days_future)
+        )
+
+        # 大范围 calendar-query 按天数分段并发请求，超时或响应过大时自动拆分
+        self.report_chunk_days = float(config.get('REPORT_CHUNK_DAYS') or 30)
+        self.report_min_chunk_days = float(config.get('REPORT_MIN_CHUNK_DAYS') or 1)
+        self.report_max_workers = int(config.get('REPORT_MAX_WORKERS') or 4)
+        self.report_max_bytes = int(float(config.get('REPORT_MAX_MB') or 20) * 1024 * 1024)
+
+        # 自适应轮询：每个集合的轮询间隔随观察到的变化频率在 [最小, 最大] 之间调整（分钟）
+        self.adaptive_poll = config_flag(config.get('ADAPTIVE_POLL'))
+        self.poll_min_interval = float(config.get('POLL_MIN_INTERVAL') or 5) * 60
+        self.poll_max_interval = float(config.get('POLL_MAX_INTERVAL') or 240) * 60
+
+        # 每个集合一个事件存储（按显示名称缓存）；EVENT_FILES=false 时事件内容只保存在集合索引中，不写单独的文件
+        self.event_files = config_flag(config.get('EVENT_FILES'))
+        self.event_stores = {}
+        self._event_stores_lock = threading.Lock()
+
+        # 集合发现结果缓存（保存在同步状态中），超过有效期后用主目录的 ctag / ETag 校验（分钟，0 表示不缓存）
+        self.discovery_ttl = float(config.get('DISCOVERY_CACHE_MINUTES') or 60) * 60
+        # 本次同步中有集合 REPORT 返回 404 时置位，同步结束后丢弃缓存
+        self.discovery_stale = False
+
+        # 同一账号内并发同步的集合数
+        self.collection_max_workers = int(config.get('COLLECTION_MAX_WORKERS') or 4)
+        # 上次发现的集合地址，用于计算下一次轮询时间
+        self.collection_hrefs = set()
+
+    def request_slot(self):
+        """占用一个请求槽（未设置请求槽时不限制），流式请求需在读取完响应体之前一直持有"""
+        return self.request_slots if self.request_slots is not None else nullcontext()
+
+    def request(self, method, url, retry_on_timeout=True, **kwargs):
+        """发送带认证的请求：失败时退避重试，服务熔断时抛出 CircuitOpenError
+
+        非流式请求在请求期间自动占用请求槽；stream=True 时由调用方通过 request_slot() 占用。
+        """
+
+        with nullcontext() if kwargs.get('stream') else self.request_slot():
+            return request_with_retry(
+                self.session, method, url,
+                breaker=self.breaker,
+                max_retries=self.max_retries,
+                backoff_base=self.backoff_base,
+                backoff_max=self.backoff_max,
+                retry_on_timeout=retry_on_timeout,
+                auth=self.auth,
+                timeout=self.timeout,
+                **kwargs
+            )
+
+    def discover_collections(self):
+        """发现日历集合"""
+
+        print(f"=== 发现{self.label}日历集合 ===")
+        print(f"账号: {self.account.account_name}")
+        print(f"用户名: {self.username}")
+        print(f"发现 URL: {self.base_url}")
+
+        # 子类声明的额外属性（如腾讯会议的 supported-calendar-component-set）
+        extra_props = "".join(f"\n        <{prop} />" for prop in self.extra_props)
+
+        propfind_body = f'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav" xmlns:CS="http://calendarserver.org/ns/">
+    <D:prop>
+        <D:displayname />
+        <D:resourcetype />
+        <CS:getctag />
+        <D:getetag />
+        <D:sync-token />
+        <C:calendar-description />{extra_props}
+    </D:prop>
+</D:propfind>'''
+
+        headers = {
+            'Content-Type': 'application/xml; charset=UTF-8',
+            'Depth': '1'
+        }
+
+        try:
+            response = self.request(
+                'PROPFIND',
+                self.base_url,
+                headers=headers,
+                data=propfind_body
+            )
+
+            print(f"HTTP 状态码: {response.status_code}")
+
+            if response.status_code == 207:
+                print("✅ 成功发现集合")
+
+                # 保存响应到临时目录
+                temp_file = self.merger.get_temp_xml_path(self.service, self.username, 'collections')
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(response.text)
+                print(f"集合发现响应已保存到 {temp_file}")
+
+                # 解析集合，并缓存结果和主目录的版本标识
+                collections = self.parse_collections(response.text)
+                if collections and self.discovery_ttl > 0:
+                    try:
+                        validator = parse_home_validator(response.text, self.base_url)
+                    except ET.ParseError:
+                        validator = None
+                    self.state_store.set_discovery(collections, validator)
+                return collections
+            else:
+                print(f"集合发现失败: {response.text[:200]}")
+                return []
+
+        except Exception as e:
+            print(f"集合发现异常: {e}")
+            return []
+
+    def fetch_home_validator(self):
+        """使用 Depth 0 PROPFIND 获取主目录的版本标识，失败或服务器不提供时返回 None"""
+
+        headers = {
+            'Content-Type': 'application/xml; charset=UTF-8',
+            'Depth': '0'
+        }
+
+        try:
+            response = self.request(
+                'PROPFIND',
+                self.base_url,
+                headers=headers,
+                data=HOME_VALIDATOR_BODY
+            )
+            if response.status_code != 207:
+                print(f"主目录校验失败 (HTTP {response.status_code})")
+                return None
+            return parse_home_validator(response.text, self.base_url)
+
+        except Exception as e:
+            print(f"主目录校验异常: {e}")
+            return None
+
+    def get_collections(self):
+        """获取日历集合：优先使用缓存的发现结果，需要最新 ctag 或缓存失效时重新发现
+
+        缓存中的 ctag 是上次发现时的值，因此只有所有集合都未到轮询时间时才直接使用缓存；
+        缓存超过有效期后先用主目录的 ctag / ETag 校验，一致时延长有效期，否则重新发现。
+        """
+
+        discovery = self.state_store.get_discovery() if self.discovery_ttl > 0 else {}
+        if not discovery.get('collections'):
+            return self.discover_collections()
+
+        collections = [dict(collection) for collection in discovery['collections']]
+        if not all(self.is_poll_deferred(collection, self.state_store.get_collection(collection['href']))
+                   for collection in collections):
+            return self.discover_collections()
+
+        age = time.time() - discovery.get('discovered_at', 0)
+        if age > self.discovery_ttl:
+            validator = discovery.get('validator')
+            if not validator or not home_validator_matches(validator, self.fetch_home_validator()):
+                print("缓存的集合列表已过期且主目录已变化（或无法校验），重新发现集合")
+                return self.discover_collections()
+            self.state_store.renew_discovery()
+            print("主目录未变化，延长集合列表缓存的有效期")
+
+        print(f"=== 使用缓存的{self.label}日历集合（{len(collections)} 个，{age / 60:.0f} 分钟前发现） ===")
+        return collections
+
+    def mark_missing_collection(self, status_code):
+        """集合 REPORT 返回 404 时标记发现结果已过期"""
+        if status_code == 404:
+            print("集合不存在 (HTTP 404)，将在同步结束后重新发现集合")
+            self.discovery_stale = True
+
+    def parse_collections(self, xml_data):
+        """解析集合响应"""
+
+        collections = []
+
+        try:
+            root = ET.fromstring(xml_data)
+            namespaces = {
+                'D': 'DAV:',
+                'C': 'urn:ietf:params:xml:ns:caldav',
+                'CS': 'http://calendarserver.org/ns/'
+            }
+
+            for response_elem in root.findall('D:response', namespaces):
+                href_elem = response_elem.find('D:href', namespaces)
+                if href_elem is not None:
+                    href = href_elem.text
+
+                    # 检查是否是日历资源
+                    resourcetype = response_elem.find('.//D:resourcetype', namespaces)
+                    if resourcetype is not None:
+                        calendar_elem = resourcetype.find('C:calendar', namespaces)
+                        if calendar_elem is not None:
+                            # 获取显示名称
+                            displayname_elem = response_elem.find('.//D:displayname', namespaces)
+                            # 空的 <D:displayname/>（如位于 404 propstat 中）text 为 None，同样使用默认名称
+                            displayname = (displayname_elem.text if displayname_elem is not None else None) or "未知日历"
+
+                            # 获取集合版本标识（ctag / sync-token），服务器不支持时为 None
+                            ctag_elem = response_elem.find('.//CS:getctag', namespaces)
+                            sync_token_elem = response_elem.find('.//D:sync-token', namespaces)
+                            ctag = ctag_elem.text if ctag_elem is not None else None
+                            sync_token = sync_token_elem.text if sync_token_elem is not None else None
+
+                            # 提取集合名称（URL 的最后部分），相对路径转换为完整 URL
+                            collection_name = href.strip('/').split('/')[-1]
+                            full_href = urljoin(self.base_url, href)
+
+                            collections.append({
+                                'name': displayname,
+                                'collection': collection_name,
+                                'href': full_href,
+                                'ctag': ctag,
+                                'sync_token': sync_token
+                            })
+
+                            print(f"找到集合: {displayname} ({collection_name})")
+
+            return collections
+
+        except ET.ParseError as e:
+            print(f"XML 解析失败: {e}")
+            return []
+
+    def download_events(self, collection, days_past=None, days_future=None):
+        """按时间范围下载指定集合的事件，请求失败时返回 None
+
+        days_past / days_future 未指定时使用完整的同步时间范围。时间范围按 REPORT_CHUNK_DAYS
+        切分后并发请求，单个分段超时或响应过大时对半拆分重试，结果按资源地址去重。
+        """
+
+        display_name = collection['name']
+        print(f"\n=== 下载集合 '{display_name}' 的事件 ===")
+
+        # 事件下载 URL
+        events_url = self.get_collection_url(collection)
+
+        print(f"事件 URL: {events_url}")
+
+        # 计算时间范围
+        days_past = self.sync_days_past if days_past is None else days_past
+        days_future = self.sync_days_future if days_future is None else days_future
+        now = datetime.utcnow()
+        start_time = now - timedelta(days=days_past)
+        end_time = now + timedelta(days=days_future)
+
+        print(f"时间范围: {start_time.strftime('%Y-%m-%d')} 到 {end_time.strftime('%Y-%m-%d')}")
+        print(f"({days_past} 天前, {days_future} 天后)")
+
+        # 切分时间范围
+        ranges = []
+        chunk = timedelta(days=self.report_chunk_days) if self.report_chunk_days > 0 else end_time - start_time
+        chunk_start = start_time
+        while chunk_start < end_time:
+            chunk_end = min(chunk_start + chunk, end_time)
+            ranges.append((chunk_start, chunk_end))
+            chunk_start = chunk_end
+
+        if len(ranges) == 1 or self.report_max_workers <= 1:
+            results = [self.fetch_time_range(collection, start, end, f'{index}') for index, (start, end) in enumerate(ranges)]
+        else:
+            print(f"分 {len(ranges)} 段并发请求（每段 {self.report_chunk_days} 天，并发数 {min(self.report_max_workers, len(ranges))}）")
+            with ThreadPoolExecutor(max_workers=min(self.report_max_workers, len(ranges))) as executor:
+                # 各分段的输出按分段顺序写回调用方（集合 / 账号）的缓冲区
+                results = map_buffered(
+                    executor,
+                    lambda item: self.fetch_time_range(collection, item[1][0], item[1][1], f'{item[0]}'),
+                    enumerate(ranges)
+                )
+
+        if any(result is None for result in results):
+            return None
+
+        # 跨分段的事件会被多个分段返回，按资源地址（没有地址时按事件键）去重
+        events = {}
+        for result in results:
+            for event in result:
+                events.setdefault(event.href or event.key, event)
+
+        if len(ranges) > 1:
+            print(f"✅ 分段下载完成，去重后共 {len(events)} 个事件")
+        return list(events.values())
+
+    def fetch_time_range(self, collection, start_time, end_time, label):
+        """使用 calendar-query 请求一个时间分段的事件，请求失败时返回 None
+
+        超时或响应超过 REPORT_MAX_BYTES 时，分段长度大于 REPORT_MIN_CHUNK_DAYS 则对半拆分后依次重试；
+        已达到最小分段长度时超时才按退避策略重试。
+        """
+
+        start_str = start_time.strftime("%Y%m%dT%H%M%SZ")
+        end_str = end_time.strftime("%Y%m%dT%H%M%SZ")
+
+        report_body = f'''<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+    <D:prop>
+        <D:getetag />
+        <C:calendar-data />
+    </D:prop>
+    <C:filter>
+        <C:comp-filter name="VCALENDAR">
+            <C:comp-filter name="VEVENT">
+                <C:time-range start="{start_str}" end="{end_str}" />
+            </C:comp-filter>
+        </C:comp-filter>
+    </C:filter>
+</C:calendar-query>'''
+
+        headers = {
+            'Content-Type': 'application/xml; charset=UTF-8',
+            'Depth': '1'
+        }
+
+        splittable = end_time - start_time > timedelta(days=self.report_min_chunk_days)
+
+        print(f"\n--- 请求分段 {label}: {start_time.strftime('%Y-%m-%d %H:%M')} 到 {end_time.strftime('%Y-%m-%d %H:%M')} ---")
+
+        try:
+            # 流式读取响应体，边下载边解析，避免在内存中保留完整的 multistatus
+            with self.request_slot(), self.request(
+                'REPORT',
+                self.get_collection_url(collection),
+                headers=headers,
+                data=report_body,
+                stream=True,
+                retry_on_timeout=not splittable
+            ) as response:
+
+                print(f"HTTP 状态码: {response.status_code}")
+
+                if response.status_code != 207:
+                    print(f"获取事件失败: {response.text[:200]}")
+                    self.mark_missing_collection(response.status_code)
+                    return None
+
+                print("✅ 成功获取事件数据")
+
+                # 响应体同时写入临时目录留档，超过大小上限时中止读取
+                safe_name = "".join(c for c in collection['collection'] if c.isalnum() or c in ('-', '_'))
+                temp_file = self.merger.get_temp_xml_path(self.service, self.username, f'events_{safe_name}_{label}')
+                chunks = limit_stream(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), self.report_max_bytes)
+                chunks = save_stream(chunks, temp_file)
+
+                if self.spool_responses:
+                    # 先完整落盘，释放请求槽后再解析，解析期间其他集合的请求可以继续
+                    for _ in chunks:
+                        pass
+                    chunks = None
+                else:
+                    # 解析和保存事件
+                    events = self.parse_and_save_events(chunks, collection)
+
+            # 解析已落盘的响应体
+            if chunks is None:
+                events = self.parse_and_save_events(read_file_chunks(temp_file), collection)
+            print(f"响应大小: {os.path.getsize(temp_file)} 字节，已保存到 {temp_file}")
+            return events
+
+        except (ResponseTooLargeError, Timeout, RequestsConnectionError) as e:
+            too_large = isinstance(e, ResponseTooLargeError)
+            if not too_large and not is_timeout_error(e):
+                print(f"获取事件异常: {e}")
+                return None
+
+            reason = "响应过大" if too_large else "请求超时"
+            if not splittable:
+                print(f"分段 {label} {reason}，已达到最小分段长度，放弃: {e}")
+                return None
+
+            middle = start_time + (end_time - start_time) / 2
+            print(f"分段 {label} {reason}，拆分为两段重试")
+            first = self.fetch_time_range(collection, start_time, middle, f'{label}a')
+            if first is None:
+                return None
+            second = self.fetch_time_range(collection, middle, end_time, f'{label}b')
+            if second is None:
+                return None
+            return first + second
+
+        except Exception as e:
+            print(f"获取事件异常: {e}")
+            return None
+
+    def parse_and_save_events(self, xml_source, collection):
+        """流式解析事件数据并写入集合的事件存储，XML 无法解析时返回 None
+
+        xml_source 可以是完整的 XML 文本或响应体数据块的迭代器。
+        """
+
+        print(f"\n--- 解析 '{collection['name']}' 中的事件 ---")
+
+        events = []
+
+        store = self.get_event_store(collection)
+
+        try:
+            event_count = 0
+            written_count = 0
+            for resource in iter_multistatus_responses(xml_source):
+                if resource['calendar_data']:
+                    event_count += 1
+                    ics_data = resource['calendar_data'].strip()
+
+                    # 解析事件记录，并记录资源地址和 ETag 以便增量同步；记录与事件存储共享同一份 UTF-8 内容
+                    event = self.parse_ics_content(ics_data)
+                    event.href = resource['href']
+                    event.etag = resource['etag']
+                    events.append(event)
+
+                    print(f"\n事件 {event_count}:")
+                    print(f"  标题: {event.summary or '无标题'}")
+                    print(f"  开始时间: {format_timestamp(event.start)}{f' ({event.tzid})' if event.tzid else ''}")
+                    print(f"  结束时间: {format_timestamp(event.end)}")
+
+                    # 按 UID (+ RECURRENCE-ID) 写入事件存储，内容未变化时不重写文件
+                    uid = event.uid or event.href or EventStore.content_hash(event.raw)
+                    event.key, written = store.put(
+                        uid, event.recurrence_id, event.raw, href=event.href, start=event.start, end=event.end,
+                        summary=event.summary
+                    )
+                    if written:
+                        written_count += 1
+                        if store.write_files:
+                            print(f"  已保存到: {store.lookup(uid, event.recurrence_id)['path']}")
+                        else:
+                            print(f"  已保存到: {store.index_path}")
+                    else:
+                        print("  内容未变化，跳过写入")
+
+            if event_count == 0:
+                print("未找到任何事件")
+            else:
+                print(f"\n✅ 总共找到 {event_count} 个事件，其中 {written_count} 个有变化并已保存")
+
+            return events
+
+        except ET.ParseError as e:
+            print(f"XML 解析失败: {e}")
+            return None
+
+    def parse_ics_content(self, ics_data):
+        """解析 ICS 内容，返回资源的事件记录（EventRecord）
+
+        UID、摘要等字段取自第一个 VEVENT；start / end 为资源中所有 VEVENT 覆盖的时间范围（UTC 时间戳），
+        包含 RRULE 的重复事件没有固定的结束时间，end 为 None。
+        """
+        return EventRecord.from_resource(ics_data)
+
+    def get_store_directory(self, collection):
+        """集合的事件存储目录：显示名称（替换路径中不能使用的字符）加集合地址的短哈希，同名集合互不影响"""
+
+        name = _UNSAFE_PATH_CHARS.sub('_', collection['name'] or '').strip(' .') or 'calendar'
+        digest = hashlib.sha1(collection['href'].encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.output_dir, f"{name}_{digest}")
+
+    def get_event_store(self, collection):
+        """获取集合对应的事件存储（按集合地址区分）"""
+
+        with self._event_stores_lock:
+            if collection['href'] not in self.event_stores:
+                self.event_stores[collection['href']] = EventStore(
+                    self.get_store_directory(collection), write_files=self.event_files
+                )
+            return self.event_stores[collection['href']]
+
+    def migrate_legacy_stores(self, collections):
+        """迁移按显示名称命名的旧事件存储目录
+
+        显示名称唯一的集合直接把旧目录改名沿用；多个集合同名时旧目录中的事件已经混在一起，
+        删除后由各集合重新完整下载（本地没有事件时不会跳过下载）。
+        没有事件索引的旧目录是更早版本按时间戳保存的事件文件（每次同步新增一批，无法对应到事件），
+        同样删除，否则按文件合并时会一直包含其中已在服务器上删除的事件。
+        """
+
+        name_counts = Counter(collection['name'] for collection in collections)
+        current_directories = {self.get_store_directory(collection) for collection in collections}
+        for collection in collections:
+            if not collection['name']:
+                continue
+            legacy_directory = os.path.join(self.output_dir, collection['name'])
+            if legacy_directory in current_directories or not os.path.isdir(legacy_directory):
+                continue
+
+            directory = self.get_store_directory(collection)
+            if not os.path.isfile(os.path.join(legacy_directory, EventStore.INDEX_FILENAME)):
+                shutil.rmtree(legacy_directory)
+                print(f"删除旧版本按时间戳保存的事件目录: {legacy_directory}")
+            elif name_counts[collection['name']] == 1 and not os.path.exists(directory):
+                os.rename(legacy_directory, directory)
+                print(f"迁移事件存储目录: {legacy_directory} -> {directory}")
+            else:
+                shutil.rmtree(legacy_directory)
+                print(f"删除同名集合共用的旧事件存储目录: {legacy_directory}（将重新完整下载）")
+
+    def has_stored_events(self, collection, event_count):
+        """检查集合上次同步的事件是否仍在本地事件存储中（可能已被清理任务删除）"""
+
+        if event_count == 0:
+            return True
+
+        return self.get_event_store(collection).count() > 0
+
+    def get_collection_url(self, collection):
+        """获取集合的事件 URL"""
+        return collection['href']
+
+    def download_events_by_href(self, collection, hrefs):
+        """使用 calendar-multiget 按资源地址批量下载事件，请求失败时返回 None"""
+
+        collection_url = self.get_collection_url(collection)
+        headers = {
+            'Content-Type': 'application/xml; charset=UTF-8',
+            'Depth': '1'
+        }
+
+        events = []
+        for i in range(0, len(hrefs), self.multiget_batch_size):
+            batch = hrefs[i:i + self.multiget_batch_size]
+            with self.request_slot(), self.request(
+                'REPORT',
+                collection_url,
+                headers=headers,
+                data=build_multiget_body(batch),
+                stream=True
+            ) as response:
+
+                if response.status_code != 207:
+                    print(f"批量获取事件失败 (HTTP {response.status_code}): {response.text[:200]}")
+                    self.mark_missing_collection(response.status_code)
+                    return None
+
+                chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+                batch_events = self.parse_and_save_events(chunks, collection)
+            if batch_events is None:
+                return None
+            events.extend(batch_events)
+
+        return events
+
+    def sync_collection_changes(self, collection, state):
+        """使用 sync-collection 增量同步集合，返回集合当前的事件数
+
+        令牌失效、服务器不支持或请求失败时返回 None，由调用方回退到按时间范围完整下载。
+        """
+
+        print(f"\n=== 增量同步集合 '{collection['name']}' ===")
+
+        collection_url = self.get_collection_url(collection)
+        sync_token = state['sync_token']
+        headers = {
+            'Content-Type': 'application/xml; charset=UTF-8',
+            'Depth': '0'
+        }
+
+        changed = {}
+        deleted = set()
+
+        try:
+            # 结果被截断 (507) 时使用新令牌继续请求剩余的变更
+            for _ in range(10):
+                response = self.request(
+                    'REPORT',
+                    collection_url,
+                    headers=headers,
+                    data=build_sync_collection_body(sync_token)
+                )
+
+                if response.status_code != 207:
+                    self.mark_missing_collection(response.status_code)
+                    if is_invalid_sync_token(response.status_code, response.text):
+                        # 清除失效的令牌，下次同步不再发送注定失败的增量请求；下一次完整下载时记录新令牌
+                        # （热窗口刷新不覆盖窗口外的变更，不能沿用发现结果中的令牌）
+                        self.state_store.update_collection(collection['href'], sync_token=None)
+                        print("同步令牌已失效，回退到按时间范围下载")
+                    else:
+                        print(f"增量同步失败 (HTTP {response.status_code})，回退到按时间范围完整下载")
+                    return None
+
+                result = parse_sync_collection(response.text)
+                for href, etag in result['changed']:
+                    changed[href] = etag
+                    deleted.discard(href)
+                for href in result['deleted']:
+                    deleted.add(href)
+                    changed.pop(href, None)
+                sync_token = result['sync_token'] or sync_token
+
+                if not result['truncated']:
+                    break
+
+            # ETag 与本地记录一致的资源无需重新下载
+            resources = dict(state.get('resources') or {})
+            hrefs_to_fetch = [
+                href for href, etag in changed.items()
+                if not etag or resources.get(href, {}).get('etag') != etag
+            ]
+            print(f"变更 {len(changed)} 个，删除 {len(deleted)} 个，需要下载 {len(hrefs_to_fetch)} 个")
+
+            events = self.download_events_by_href(collection, hrefs_to_fetch) if hrefs_to_fetch else []
+            if events is None:
+                return None
+
+        except Exception as e:
+            print(f"增量同步异常: {e}，回退到按时间范围完整下载")
+            return None
+
+        # 更新本地资源记录：已删除的事件记录墓碑，UID 发生变化的资源移除旧事件
+        store = self.get_event_store(collection)
+        for href in deleted:
+            resource = resources.pop(href, None)
+            if resource:
+                store.delete(resource['key'])
+        for event in events:
+            previous = resources.get(event.href)
+            if previous and previous['key'] != event.key:
+                store.delete(previous['key'])
+            resources[event.href] = {'etag': event.etag, 'key': event.key}
+
+        self.state_store.update_collection(
+            collection['href'],
+            ctag=collection['ctag'],
+            sync_token=sync_token,
+            event_count=len(resources),
+            resources=resources,
+            delta_synced_at=time.time()
+        )
+        store.save()
+
+        print(f"✅ 增量同步完成，集合当前共有 {len(resources)} 个事件")
+        return len(resources)
+
+    def is_poll_deferred(self, collection, state):
+        """判断集合是否未到下一次轮询时间
+
+        已知 ctag 发生变化、超过 ctag 有效期或本地事件缺失时不推迟。
+        """
+
+        if not self.adaptive_poll or time.time() >= state.get('next_poll_at', 0):
+            return False
+        if collection['ctag'] and collection['ctag'] != state.get('ctag'):
+            return False
+        if time.time() - state.get('synced_at', 0) > self.ctag_max_age:
+            return False
+        return self.has_stored_events(collection, state.get('event_count', 0))
+
+    def update_poll_interval(self, collection, previous_state):
+        """根据本次轮询是否观察到变化调整集合的轮询间隔：有变化时减半，无变化时增加 50%"""
+
+        current_state = self.state_store.get_collection(collection['href'])
+        changed = (
+            current_state.get('ctag') != previous_state.get('ctag')
+            or current_state.get('resources') != previous_state.get('resources')
+        )
+
+        interval = previous_state.get('poll_interval') or self.poll_min_interval
+        interval = interval / 2 if changed else interval * 1.5
+        interval = min(self.poll_max_interval, max(self.poll_min_interval, interval))
+
+        now = time.time()
+        values = {'poll_interval': interval, 'next_poll_at': now + interval}
+        if changed:
+            values['changed_at'] = now
+        self.state_store.update_collection(collection['href'], **values)
+
+    def get_next_poll_at(self):
+        """获取本账号上次发现的集合中最早需要轮询的时间戳，没有轮询记录时返回 None"""
+
+        times = [state['next_poll_at'] for href, state in self.state_store.get_collections().items()
+                 if href in self.collection_hrefs and state.get('next_poll_at')]
+        return min(times) if times else None
+
+    def sync_collection(self, collection):
+        """同步单个集合，返回集合当前的事件数，失败时返回 None
+
+        未到自适应轮询时间的集合直接沿用上次的结果，其余集合拉取后根据是否变化调整轮询间隔。
+        """
+
+        state = self.state_store.get_collection(collection['href'])
+        if self.is_poll_deferred(collection, state):
+            remaining = (state['next_poll_at'] - time.time()) / 60
+            print(f"\n集合 '{collection['name']}' 未到轮询时间（{remaining:.0f} 分钟后），沿用上次的 {state.get('event_count', 0)} 个事件")
+            return state.get('event_count', 0)
+
+        event_count = self.fetch_collection(collection, state)
+        if event_count is not None and self.adaptive_poll:
+            self.update_poll_interval(collection, state)
+        return event_count
+
+    def fetch_collection(self, collection, state):
+        """拉取单个集合，返回集合当前的事件数，失败时返回 None
+
+        依次尝试：ctag 未变化时跳过 -> sync-collection 增量同步 -> 按时间范围完整下载。
+        """
+
+        unchanged = self.state_store.is_collection_unchanged(
+            collection['href'], collection['ctag'], collection['sync_token'], self.ctag_max_age
+        )
+        if unchanged and self.has_stored_events(collection, state.get('event_count', 0)):
+            print(f"\n集合 '{collection['name']}' 未变化，跳过下载，沿用上次的 {state.get('event_count', 0)} 个事件")
+            return state.get('event_count', 0)
+
+        # 增量同步要求本地有完整的资源记录，且距上次完整下载未超过 ctag 有效期（保证滚动时间窗口前移）
+        can_delta = (
+            self.delta_sync
+            and state.get('sync_token')
+            and state.get('resources') is not None
+            and time.time() - state.get('synced_at', 0) <= self.ctag_max_age
+            and self.has_stored_events(collection, state.get('event_count', 0))
+        )
+        if can_delta:
+            event_count = self.sync_collection_changes(collection, state)
+            if event_count is not None:
+                return event_count
+
+        # 分层窗口：已有完整同步结果且未到冷刷新时间时只刷新热窗口
+        hot_only = (
+            self.tiered_sync
+            and state.get('resources') is not None
+            and time.time() - state.get('synced_at', 0) <= self.cold_refresh
+            and self.has_stored_events(collection, state.get('event_count', 0))
+        )
+        if hot_only:
+            return self.refresh_hot_window(collection, state)
+
+        events = self.download_events(collection)
+        if events is None:
+            return None
+
+        # 完整下载后以新结果为准，本次未返回的事件记录为墓碑
+        resources = {
+            event.href: {'etag': event.etag, 'key': event.key}
+            for event in events if event.href
+        }
+        store = self.get_event_store(collection)
+        seen_keys = {event.key for event in events}
+        for key, _ in store.iter_events():
+            if key not in seen_keys:
+                store.delete(key)
+
+        self.state_store.update_collection(
+            collection['href'],
+            ctag=collection['ctag'],
+            sync_token=collection['sync_token'],
+            event_count=len(events),
+            resources=resources,
+            synced_at=time.time()
+        )
+        store.save()
+        return len(events)
+
+    def refresh_hot_window(self, collection, state):
+        """只下载热窗口内的事件并合并到事件存储，返回集合当前的事件数，失败时返回 None
+
+        时间范围完全落在热窗口内侧（两端各留一天余量，抵消时区近似误差）而本次未返回的事件，
+        先按资源地址用 calendar-multiget 确认：服务器仍返回的事件（如被移出了热窗口）更新后保留，
+        返回 404 或未返回的才记录为墓碑；确认请求失败时暂不删除。窗口外的事件保持不变，由下一次冷刷新（完整下载）更新。
+        """
+
+        print(f"\n集合 '{collection['name']}' 只刷新热窗口（距上次完整同步 {(time.time() - state.get('synced_at', 0)) / 3600:.1f} 小时）")
+        events = self.download_events(collection, self.hot_days_past, self.hot_days_future)
+        if events is None:
+            return None
+
+        store = self.get_event_store(collection)
+        now = time.time()
+        inner_start = now - (self.hot_days_past - 1) * 86400
+        inner_end = now + (self.hot_days_future - 1) * 86400
+        window_count = len(events)
+        seen_keys = {event.key for event in events}
+        missing_keys = [
+            key for key in store.keys_within(inner_start, inner_end) if key not in seen_keys
+        ] if inner_start < inner_end else []
+
+        # 有资源地址的事件先确认是否仍存在，没有地址的事件无法确认，直接视为已删除
+        unconfirmed_keys = set()
+        hrefs = [store.events[key]['href'] for key in missing_keys if store.events[key].get('href')]
+        if hrefs:
+            print(f"热窗口内有 {len(hrefs)} 个事件未返回，按资源地址确认")
+            try:
+                confirmed = self.download_events_by_href(collection, hrefs)
+            except Exception as e:
+                print(f"确认请求异常: {e}")
+                confirmed = None
+            if confirmed is None:
+                print("确认请求失败，本次不删除这些事件")
+                unconfirmed_keys = {key for key in missing_keys if store.events[key].get('href')}
+            else:
+                events.extend(confirmed)
+                seen_keys.update(event.key for event in confirmed)
+
+        removed_keys = set()
+        for key in missing_keys:
+            if key not in seen_keys and key not in unconfirmed_keys and store.delete(key):
+                removed_keys.add(key)
+
+        # 资源记录：保留窗口外的资源，更新本次返回的资源
+        resources = {
+            href: resource for href, resource in (state.get('resources') or {}).items()
+            if resource['key'] not in removed_keys and resource['key'] not in seen_keys
+        }
+        for event in events:
+            if event.href:
+                resources[event.href] = {'etag': event.etag, 'key': event.key}
+
+        event_count = store.count()
+        self.state_store.update_collection(
+            collection['href'],
+            ctag=collection['ctag'],
+            event_count=event_count,
+            resources=resources,
+            hot_synced_at=time.time()
+        )
+        store.save()
+
+        print(f"热窗口返回 {window_count} 个事件，删除 {len(removed_keys)} 个，集合当前共有 {event_count} 个事件")
+        return event_count
+
+    def _sync_collection_isolated(self, collection):
+        """同步单个集合，异常只影响该集合（返回 None），不中断其他集合"""
+
+        try:
+            return self.sync_collection(collection)
+        except Exception as e:
+            print(f"❌ 集合 '{collection['name']}' 同步异常: {e}")
+            return None
+
+    def begin_sync(self):
+        """开始一次同步：发现集合（或使用缓存的发现结果），未发现集合时返回空列表"""
+
+        print(f"=== 开始同步{self.label}账号: {self.account.account_name} ===")
+
+        self.discovery_stale = False
+        collections = self.get_collections()
+
+        if not collections:
+            print("❌ 未发现任何日历集合")
+            return []
+
+        print(f"\n发现了 {len(collections)} 个日历集合")
+        self.collection_hrefs = {collection['href'] for collection in collections}
+        self.migrate_legacy_stores(collections)
+        return collections
+
+    def finish_sync(self, collections, event_counts):
+        """结束一次同步：汇总各集合的事件数并保存同步状态，有事件时返回 True"""
+
+        total_events = 0
+        for collection, event_count in zip(collections, event_counts):
+            if event_count:
+                total_events += event_count
+            elif event_count == 0:
+                print(f"集合 '{collection['name']}' 中没有符合时间范围的事件")
+
+        # 缓存的集合已不存在时丢弃发现结果，下次同步时重新发现
+        if self.discovery_stale:
+            self.state_store.invalidate_discovery()
+        self.state_store.save()
+
+        # 刷新账号目录的修改时间，避免仍在使用的事件存储被清理任务当作过期目录删除
+        if os.path.isdir(self.output_dir):
+            os.utime(self.output_dir)
+
+        print(f"\n🎉 {self.label}同步完成！总共下载了 {total_events} 个事件")
+        print(f"所有事件已保存到 {self.output_dir}/ 目录下")
+
+        return total_events > 0
+
+    def sync(self):
+        """执行同步操作"""
+
+        try:
+            # 步骤1: 发现集合（或使用缓存的发现结果）
+            collections = self.begin_sync()
+            if not collections:
+                return False
+
+            # 步骤2: 同步每个集合的事件（跳过未变化的集合，优先增量同步），多个集合并发同步
+            workers = min(self.collection_max_workers, len(collections))
+            if workers <= 1:
+                event_counts = [self._sync_collection_isolated(collection) for collection in collections]
+            else:
+                print(f"并发同步集合，线程数: {workers}")
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    # 各集合的输出按集合顺序写回账号的缓冲区
+                    event_counts = map_buffered(executor, self._sync_collection_isolated, collections)
+
+            # 步骤3: 汇总并保存同步状态
+            return self.finish_sync(collections, event_counts)
+
+        except Exception as e:
+            print(f"❌ {self.label}同步过程中发生异常: {e}")
+            return False
@@ -6,9 +6,18 @@
 负责从 .env 文件中读取和解析账号配置信息
 """
 
+import hashlib
 import os
+import re
 from typing import Dict, List, Optional
 from dataclasses import dataclass
+from providers import get_provider_types
+
+def config_flag(value, default: bool = True) -> bool:
+    """解析开关类配置项：未配置（None 或空字符串）时返回 default，0 / false / no / off 为关闭，其他值为开启"""
+    if value is None or str(value).strip() == '':
+        return default
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'off')
 
 @dataclass
 class CalDAVAccount:
@@ -23,6 +32,11 @@ class CalDAVAccount:
         """获取格式化后的 URL（替换用户名占位符）"""
         return self.url.format(username=self.username)
 
+    def get_shard_index(self, shard_count: int) -> int:
+        """按账号类型和名称的 SHA-1 计算所属分片，结果与进程和 Python 哈希随机化无关"""
+        digest = hashlib.sha1(f"{self.account_type}:{self.account_name}".encode('utf-8')).hexdigest()
+        return int(digest, 16) % shard_count
+
 class ConfigManager:
     """配置管理器"""
 
@@ -30,6 +44,9 @@ class ConfigManager:
         self.env_file = env_file
         self.config = {}
         self.accounts = []
+        # 按名称、按类型的索引，查找账号为 O(1)
+        self.accounts_by_name: Dict[str, CalDAVAccount] = {}
+        self.accounts_by_type: Dict[str, List[CalDAVAccount]] = {}
         self.load_config()
 
     def load_config(self):
@@ -49,44 +66,73 @@ class ConfigManager:
         self._parse_accounts()
 
     def _parse_accounts(self):
-        """解析账号配置"""
-        # 支持的账号类型
-        account_types = ['DINGTALK', 'TENCENT', 'GOOGLE', 'OUTLOOK']
+        """解析账号配置
+
+        每种类型支持一个不带编号的账号（DINGTALK_USERNAME 等）和任意多个带编号的账号
+        （DINGTALK_1_USERNAME、DINGTALK_2_USERNAME 等，编号可以不连续）。
+        带编号的账号未配置 URL 时使用同类型不带编号的 URL 模板。
+        """
+        # 支持的账号类型（来自处理器注册表）
+        account_types = [account_type.upper() for account_type in get_provider_types()]
 
         for account_type in account_types:
-            account_name = self.config.get(f'{account_type}_ACCOUNT_NAME')
-            username = self.config.get(f'{account_type}_USERNAME')
-            password = self.config.get(f'{account_type}_PASSWORD')
-            url = self.config.get(f'{account_type}_URL')
-
-            # 只有当所有必需字段都存在时才创建账号
-            if all([account_name, username, password, url]):
-                account = CalDAVAccount(
-                    account_type=account_type.lower(),
-                    account_name=account_name,
-                    username=username,
-                    password=password,
-                    url=url
-                )
-                self.accounts.append(account)
+            prefixes = [account_type]
+            indexes = set()
+            pattern = re.compile(rf'^{account_type}_(\d+)_ACCOUNT_NAME$')
+            for key in self.config:
+                match = pattern.match(key)
+                if match:
+                    indexes.add(int(match.group(1)))
+            prefixes.extend(f'{account_type}_{index}' for index in sorted(indexes))
+
+            for prefix in prefixes:
+                account_name = self.config.get(f'{prefix}_ACCOUNT_NAME')
+                username = self.config.get(f'{prefix}_USERNAME')
+                password = self.config.get(f'{prefix}_PASSWORD')
+                url = self.config.get(f'{prefix}_URL') or self.config.get(f'{account_type}_URL')
+
+                # 只有当所有必需字段都存在时才创建账号
+                if all([account_name, username, password, url]):
+                    account = CalDAVAccount(
+                        account_type=account_type.lower(),
+                        account_name=account_name,
+                        username=username,
+                        password=password,
+                        url=url
+                    )
+                    self._add_account(account)
+
+    def _add_account(self, account: CalDAVAccount):
+        """添加账号并更新索引，名称重复的账号会被忽略"""
+
+        if account.account_name in self.accounts_by_name:
+            print(f"⚠️ 账号名称重复，已忽略: {account.account_name}")
+            return
+
+        self.accounts.append(account)
+        self.accounts_by_name[account.account_name] = account
+        self.accounts_by_type.setdefault(account.account_type, []).append(account)
 
     def get_accounts(self) -> List[CalDAVAccount]:
         """获取所有配置的账号"""
         return self.accounts
 
+    def get_shard_accounts(self, shard_index: int, shard_count: int) -> List[CalDAVAccount]:
+        """获取属于指定分片的账号（分片编号从 0 开始）"""
+        return [account for account in self.accounts if account.get_shard_index(shard_count) == shard_index]
+
     def get_account_by_type(self, account_type: str) -> Optional[CalDAVAccount]:
-        """根据类型获取账号"""
-        for account in self.accounts:
-            if account.account_type == account_type.lower():
-                return account
-        return None
+        """根据类型获取账号（该类型的第一个账号）"""
+        accounts = self.accounts_by_type.get(account_type.lower())
+        return accounts[0] if accounts else None
+
+    def get_accounts_by_type(self, account_type: str) -> List[CalDAVAccount]:
+        """根据类型获取所有账号"""
+        return list(self.accounts_by_type.get(account_type.lower(), []))
 
     def get_account_by_name(self, account_name: str) -> Optional[CalDAVAccount]:
         """根据名称获取账号"""
-        for account in self.accounts:
-            if account.account_name == account_name:
-                return account
-        return None
+        return self.accounts_by_name.get(account_name)
 
     def get_global_config(self, key: str, default=None):
         """获取全局配置"""
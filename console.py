@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+控制台输出工具
+并发执行时按线程缓冲 print 输出，保证每个任务的日志整块输出、互不交错
+"""
+
+import io
+import sys
+import threading
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+class _ThreadLocalStdout:
+    """按线程分流的 stdout 代理：当前线程开启缓冲时写入缓冲区，否则写入原始输出"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    @property
+    def current_buffer(self):
+        return getattr(self._local, 'buffer', None)
+
+    @current_buffer.setter
+    def current_buffer(self, buffer):
+        self._local.buffer = buffer
+
+    def write(self, text):
+        buffer = self.current_buffer
+        if buffer is not None:
+            return buffer.write(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        if self.current_buffer is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+_install_lock = threading.Lock()
+_output_lock = threading.Lock()
+_proxy = None
+
+def _install_proxy() -> _ThreadLocalStdout:
+    """安装 stdout 代理（幂等）"""
+    global _proxy
+
+    with _install_lock:
+        if _proxy is None or sys.stdout is not _proxy:
+            _proxy = _ThreadLocalStdout(sys.stdout)
+            sys.stdout = _proxy
+        return _proxy
+
+@contextmanager
+def buffered_output():
+    """缓冲当前线程的输出，退出时一次性写出
+
+    嵌套使用时内层内容写回外层缓冲区，只有最外层才真正输出到控制台。
+    """
+    proxy = _install_proxy()
+    previous = proxy.current_buffer
+    buffer = io.StringIO()
+    proxy.current_buffer = buffer
+
+    try:
+        yield buffer
+    finally:
+        proxy.current_buffer = previous
+        _emit(proxy, buffer.getvalue())
+
+def _emit(proxy: _ThreadLocalStdout, content: str):
+    """把一段缓冲的输出写到当前线程的输出：有外层缓冲区时写入缓冲区，否则整块输出到控制台"""
+    if not content:
+        return
+    if proxy.current_buffer is not None:
+        proxy.current_buffer.write(content)
+    else:
+        with _output_lock:
+            proxy.write(content)
+            proxy.flush()
+
+def map_buffered(executor: Executor, func: Callable, items: Iterable) -> list:
+    """用线程池并发执行 func，每个任务的输出单独缓冲，按任务顺序写回调用线程的输出，返回结果列表
+
+    工作线程没有调用线程的缓冲区，直接在其中使用 buffered_output 会绕过外层缓冲直接输出到控制台；
+    这里把每个任务捕获的输出交回调用线程，写入调用方的缓冲区（没有时整块输出到控制台）。
+    任务抛出异常时，先写出它及之前任务的输出再抛出。
+    """
+    proxy = _install_proxy()
+
+    def run(item):
+        previous = proxy.current_buffer
+        buffer = io.StringIO()
+        proxy.current_buffer = buffer
+        try:
+            return buffer, func(item), None
+        except Exception as e:
+            return buffer, None, e
+        finally:
+            proxy.current_buffer = previous
+
+    results = []
+    for buffer, result, error in executor.map(run, items):
+        _emit(proxy, buffer.getvalue())
+        if error is not None:
+            raise error
+        results.append(result)
+    return results
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+守护进程模块
+常驻运行 CalDAVSyncManager，由内部调度器按账号间隔（带随机抖动）同步，并定期合并与清理
+"""
+
+import heapq
+import itertools
+import random
+import signal
+import threading
+import time
+from typing import List, Tuple
+
+from http_client import close_session
+
+class SyncDaemon:
+    """同步守护进程
+
+    所有任务都在调度线程中执行：到期的账号一起交给管理器的有界线程池同步，
+    合并和清理在两批同步之间运行，因此不会与同步同时读写事件存储。
+    收到 SIGTERM / SIGINT 后等待当前任务完成，再做最后一次合并并退出。
+    """
+
+    def __init__(self, manager, cleanup_days: int = 7):
+        self.manager = manager
+        self.cleanup_days = cleanup_days
+        self.stop_event = threading.Event()
+
+        config = manager.config_manager
+        self.sync_interval = float(config.get_global_config('DAEMON_SYNC_INTERVAL') or 15) * 60
+        self.merge_interval = float(config.get_global_config('DAEMON_MERGE_INTERVAL') or 5) * 60
+        self.cleanup_interval = float(config.get_global_config('DAEMON_CLEANUP_INTERVAL') or 24) * 3600
+        # 抖动比例：每次调度在间隔基础上随机增加 0 ~ jitter * 间隔，避免所有账号同时请求
+        self.jitter = float(config.get_global_config('DAEMON_JITTER') or 0.1)
+
+        self._queue: List[Tuple[float, int, str, object]] = []
+        self._sequence = itertools.count()
+        self._pending_merge = False
+
+    def get_account_interval(self, account) -> float:
+        """获取账号的同步间隔（秒）：{TYPE}_SYNC_INTERVAL（分钟）优先，其次 DAEMON_SYNC_INTERVAL"""
+        value = self.manager.config_manager.get_global_config(f'{account.account_type.upper()}_SYNC_INTERVAL')
+        return float(value) * 60 if value else self.sync_interval
+
+    def _jittered(self, interval: float) -> float:
+        return interval + random.uniform(0, interval * self.jitter)
+
+    def schedule(self, delay: float, kind: str, payload=None):
+        """安排任务在 delay 秒后执行"""
+        heapq.heappush(self._queue, (time.time() + delay, next(self._sequence), kind, payload))
+
+    def request_stop(self, signum=None, frame=None):
+        """请求退出（信号处理函数），当前任务完成后停止"""
+        if not self.stop_event.is_set():
+            print(f"\n收到退出信号，等待当前任务完成后退出...")
+        self.stop_event.set()
+
+    def _install_signal_handlers(self):
+        # 信号处理函数只能在主线程中注册
+        if threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+    def _pop_due(self, kind: str, now: float) -> list:
+        """取出所有已到期的指定类型任务"""
+        due = [item for item in self._queue if item[0] <= now and item[2] == kind]
+        if due:
+            self._queue = [item for item in self._queue if not (item[0] <= now and item[2] == kind)]
+            heapq.heapify(self._queue)
+        return due
+
+    def _run_syncs(self, due: list):
+        """同步到期的账号并安排下一次同步"""
+
+        accounts = [item[3] for item in due]
+        print(f"\n⏰ [{time.strftime('%Y-%m-%d %H:%M:%S')}] 同步 {len(accounts)} 个到期账号")
+        success_count = self.manager.sync_accounts(accounts)
+        print(f"成功: {success_count}/{len(accounts)} 个账号")
+
+        if success_count:
+            self._pending_merge = True
+        for account in accounts:
+            # 优先按集合的自适应轮询间隔安排，没有轮询记录时使用账号的固定间隔
+            delay = self.manager.get_next_sync_delay(account)
+            if delay is None:
+                delay = self.get_account_interval(account)
+            self.schedule(self._jittered(delay), 'sync', account)
+
+    def _run_merge(self):
+        """合并有更新的事件"""
+
+        if not self._pending_merge:
+            return
+        print(f"\n📋 [{time.strftime('%Y-%m-%d %H:%M:%S')}] 合并事件")
+        try:
+            self.manager.merge_configured_types()
+            self._pending_merge = False
+        except Exception as e:
+            print(f"❌ 合并异常: {e}")
+
+    def _run_cleanup(self):
+        """清理临时文件，并让常驻处理器重新加载被清理过的事件存储"""
+
+        print(f"\n🧹 [{time.strftime('%Y-%m-%d %H:%M:%S')}] 清理临时文件")
+        self.manager.cleanup_temp_files(self.cleanup_days)
+        self.manager.reset_event_stores()
+
+    def run(self) -> bool:
+        """运行调度循环直到收到退出信号"""
+
+        self._install_signal_handlers()
+
+        accounts = self.manager.get_accounts()
+        if not accounts:
+            print("❌ 未找到任何配置的账号")
+            return False
+
+        print(f"🚀 守护进程启动: {len(accounts)} 个账号，默认同步间隔 {self.sync_interval / 60:g} 分钟，"
+              f"合并间隔 {self.merge_interval / 60:g} 分钟，清理间隔 {self.cleanup_interval / 3600:g} 小时")
+
+        # 首轮同步在抖动范围内错开
+        for account in accounts:
+            self.schedule(random.uniform(0, self.get_account_interval(account) * self.jitter), 'sync', account)
+        self.schedule(self.merge_interval, 'merge')
+        self.schedule(self.cleanup_interval, 'cleanup')
+
+        try:
+            while not self.stop_event.is_set():
+                now = time.time()
+                due_syncs = self._pop_due('sync', now)
+                if due_syncs:
+                    self._run_syncs(due_syncs)
+
+                for _ in self._pop_due('merge', time.time()):
+                    self._run_merge()
+                    self.schedule(self.merge_interval, 'merge')
+
+                for _ in self._pop_due('cleanup', time.time()):
+                    self._run_cleanup()
+                    self.schedule(self.cleanup_interval, 'cleanup')
+
+                # 等待下一个任务到期或退出信号
+                self.stop_event.wait(max(0.0, self._queue[0][0] - time.time()) if self._queue else None)
+        finally:
+            # 退出前合并最后一批同步结果
+            self._run_merge()
+            close_session()
+            print("👋 守护进程已退出")
+
+        return True
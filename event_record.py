@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件记录模块
+同步处理器和合并工具共用的紧凑事件模型：每个事件一个 __slots__ 对象，
+UID / TZID 驻留为共享字符串，起止时间为整数时间戳，事件内容以 UTF-8 字节保存
+"""
+
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from ics_parser import (
+    Component, content_line_value, iter_components, parse_content_line, parse_ics_timestamp, unescape_text
+)
+
+# 构造记录需要的 VEVENT 属性
+_RECORD_PROPERTIES = frozenset({'UID', 'RECURRENCE-ID', 'DTSTART', 'DTEND', 'RRULE', 'RDATE',
+                                'SEQUENCE', 'LAST-MODIFIED', 'SUMMARY'})
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """驻留重复出现的短字符串（UID、RECURRENCE-ID、TZID），空值返回 None"""
+    return sys.intern(value) if value else None
+
+def format_timestamp(value: Optional[int]) -> str:
+    """把 UTC 时间戳格式化为日志中显示的时间"""
+    if value is None:
+        return '未知'
+    return datetime.fromtimestamp(value, timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+class EventRecord:
+    """一个日历事件的紧凑记录
+
+    start / end 为 UTC 时间戳（带 TZID 的本地时间按 UTC 近似），包含 RRULE / RDATE 的重复事件 end 为 None；
+    raw 为事件内容（展开折行后的 VEVENT，或同步时整个资源）的 UTF-8 字节，与事件存储的内存缓存共享。
+    href / etag / key 只在同步时填写，分别为资源地址、ETag 和事件存储中的事件键。
+    """
+
+    __slots__ = ('uid', 'recurrence_id', 'tzid', 'start', 'end', 'sequence', 'last_modified',
+                 'summary', 'raw', 'href', 'etag', 'key')
+
+    def __init__(self, uid: Optional[str] = None, recurrence_id: Optional[str] = None,
+                 tzid: Optional[str] = None, start: Optional[int] = None, end: Optional[int] = None,
+                 sequence: int = 0, last_modified: str = '', summary: Optional[str] = None,
+                 raw: bytes = b''):
+        self.uid = _intern(uid)
+        self.recurrence_id = _intern(recurrence_id)
+        self.tzid = _intern(tzid)
+        self.start = start
+        self.end = end
+        self.sequence = sequence
+        self.last_modified = last_modified
+        self.summary = summary
+        self.raw = raw
+        self.href = None
+        self.etag = None
+        self.key = None
+
+    @classmethod
+    def from_component(cls, vevent: Component) -> 'EventRecord':
+        """从 VEVENT 组件构造记录，raw 为组件展开折行后的文本"""
+
+        # 一次遍历取出所有需要的属性行，只有 DTSTART 需要解析参数
+        lines = vevent.get_first_lines(_RECORD_PROPERTIES)
+
+        def value_of(name: str) -> Optional[str]:
+            line = lines.get(name)
+            return content_line_value(line).strip() if line is not None else None
+
+        dtstart = parse_content_line(lines['DTSTART']) if 'DTSTART' in lines else None
+        start = end = tzid = None
+        if dtstart is not None:
+            tzid = dtstart.params.get('TZID')
+            start = parse_ics_timestamp(dtstart.value)
+
+        if start is not None and 'RRULE' not in lines and 'RDATE' not in lines:
+            end = parse_ics_timestamp(value_of('DTEND'))
+            if end is None:
+                # 没有 DTEND 时，全天事件持续一天，其他事件视为瞬时事件
+                all_day = dtstart.params.get('VALUE') == 'DATE' or len(dtstart.value.strip()) == 8
+                end = start + (86400 if all_day else 0)
+
+        sequence = value_of('SEQUENCE')
+        try:
+            sequence_number = int(sequence) if sequence else 0
+        except ValueError:
+            sequence_number = 0
+
+        summary = value_of('SUMMARY')
+        return cls(
+            uid=value_of('UID'),
+            recurrence_id=value_of('RECURRENCE-ID'),
+            tzid=tzid,
+            start=start,
+            end=end,
+            sequence=sequence_number,
+            last_modified=value_of('LAST-MODIFIED') or '',
+            summary=unescape_text(summary) if summary is not None else None,
+            raw=vevent.text.encode('utf-8')
+        )
+
+    @classmethod
+    def from_resource(cls, ics_data: str, raw: Optional[bytes] = None) -> 'EventRecord':
+        """从一个 CalDAV 资源（可能包含同一事件的多个 VEVENT）构造记录
+
+        UID、RECURRENCE-ID、摘要等字段取自第一个 VEVENT，start / end 为所有 VEVENT 覆盖的时间范围，
+        任一 VEVENT 为重复事件时 end 为 None；raw 为整个资源的内容，未传入时由 ics_data 编码。
+        """
+
+        # 只解析 VEVENT，VTIMEZONE 等其他组件中的 DTSTART 不属于事件
+        vevents = [cls.from_component(vevent) for vevent in iter_components(ics_data, ('VEVENT',))]
+        record = vevents[0] if vevents else cls()
+        timed = [vevent for vevent in vevents if vevent.start is not None]
+        if timed:
+            record.start = min(vevent.start for vevent in timed)
+            record.end = None if any(vevent.end is None for vevent in timed) else max(vevent.end for vevent in timed)
+        record.raw = raw if raw is not None else ics_data.encode('utf-8')
+        return record
+
+    @property
+    def version(self) -> Tuple[int, str]:
+        """用于比较新旧的 (SEQUENCE, LAST-MODIFIED)"""
+        return self.sequence, self.last_modified
+
+    @property
+    def identity(self) -> Tuple[Optional[str], object]:
+        """去重用的身份：(UID, RECURRENCE-ID)；没有 UID 的事件无法识别身份，以内容区分"""
+        return (self.uid, self.recurrence_id) if self.uid else (None, self.raw)
+
+    @property
+    def text(self) -> str:
+        """事件内容文本"""
+        return self.raw.decode('utf-8')
+
+    def __repr__(self) -> str:
+        return f"EventRecord(uid={self.uid!r}, recurrence_id={self.recurrence_id!r}, start={self.start}, end={self.end})"
+
+def parse_vevents(content: str) -> Tuple[List[EventRecord], Dict[str, str]]:
+    """解析 ICS 文本，返回 (每个 VEVENT 的记录, {TZID: VTIMEZONE 文本})
+
+    同一 TZID 只保留第一个定义；缺少 TZID 的 VTIMEZONE 以其文本作为键，只去除完全相同的副本。
+    """
+
+    vevents = []
+    vtimezones = {}
+    for component in iter_components(content, ('VEVENT', 'VTIMEZONE')):
+        if component.name == 'VEVENT':
+            vevents.append(EventRecord.from_component(component))
+        else:
+            vtimezones.setdefault(component.get_value('TZID') or component.text, component.text)
+    return vevents, vtimezones
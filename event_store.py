@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件存储模块
+按 UID (+ RECURRENCE-ID) 存储日历事件，内容哈希不变时不重写文件，消失的事件记录为墓碑
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from interval_index import IntervalHit, IntervalIndex
+
+class EventStore:
+    """单个日历集合的事件存储
+
+    目录结构:
+        {directory}/{key_digest}.ics   每个事件一个文件，文件名由事件键的哈希决定，保持稳定
+        {directory}/.index.json        事件索引：键 -> UID、RECURRENCE-ID、内容哈希、文件名、资源地址等
+        {directory}/.intervals.json    时间区间索引（interval_index.IntervalIndex），保存事件索引时增量更新
+
+    write_files=False 时不写单独的事件文件，事件内容保存在索引记录的 data 字段中，
+    每个集合只读写一个文件。两种模式可以互相切换，读取时优先使用索引中的内容。
+    写入和读取过的事件内容以 UTF-8 字节缓存在内存中（与同步得到的 EventRecord.raw 共享同一对象），
+    合并时可直接使用，不再重复读取文件；不写文件时索引中的内容本身就在内存中，不再另外缓存。
+    """
+
+    INDEX_FILENAME = '.index.json'
+    # 一次保存中变化的事件超过该数量时，直接由全部事件重建时间区间索引（逐个增删每次都要移动数组）
+    INTERVAL_INCREMENTAL_LIMIT = 256
+
+    def __init__(self, directory: str, write_files: bool = True):
+        self.directory = directory
+        self.write_files = write_files
+        self.index_path = os.path.join(directory, self.INDEX_FILENAME)
+        self.intervals_path = os.path.join(directory, IntervalIndex.FILENAME)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._contents: Dict[str, bytes] = {}
+        # 时间区间索引在首次查询或保存时加载，此前变化的事件键记录在 _interval_changes 中
+        self._intervals: Optional[IntervalIndex] = None
+        self._interval_changes: Set[str] = set()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.events = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        """读取索引；目录中没有索引时清理旧版本遗留的时间戳命名文件"""
+
+        if not os.path.exists(self.index_path):
+            legacy_files = glob.glob(os.path.join(self.directory, '*.ics'))
+            for filepath in legacy_files:
+                os.remove(filepath)
+            if legacy_files:
+                print(f"已清理 {len(legacy_files)} 个旧格式事件文件: {self.directory}")
+                self._dirty = True
+            return {}
+
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('events', {})
+        except (OSError, ValueError) as e:
+            print(f"读取事件索引失败 {self.index_path}: {e}")
+            return {}
+
+    @staticmethod
+    def make_key(uid: str, recurrence_id: Optional[str] = None) -> str:
+        """生成事件键：UID，重复事件的单次实例附加 RECURRENCE-ID"""
+        return f"{uid}#{recurrence_id}" if recurrence_id else uid
+
+    @staticmethod
+    def content_hash(ics_data: Union[str, bytes]) -> str:
+        """计算事件内容哈希（文本按 UTF-8 编码）"""
+        if isinstance(ics_data, str):
+            ics_data = ics_data.encode('utf-8')
+        return hashlib.sha256(ics_data).hexdigest()
+
+    def _filepath(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.ics")
+
+    def put(self, uid: str, recurrence_id: Optional[str], ics_data: Union[str, bytes], href: Optional[str] = None,
+            start: Optional[int] = None, end: Optional[int] = None, summary: Optional[str] = None) -> Tuple[str, bool]:
+        """写入事件，返回 (事件键, 是否实际写入了文件)
+
+        ics_data 可以是文本或 UTF-8 字节（如 EventRecord.raw，直接缓存而不复制）。
+        start / end 为事件覆盖的时间范围（UTC 时间戳），未知时为 None，重复事件的 end 为 None；
+        summary 为事件标题，与起止时间一起写入时间区间索引。内容哈希与已存储版本一致且文件仍在时不重写。
+        """
+        key = self.make_key(uid, recurrence_id)
+        data = ics_data.encode('utf-8') if isinstance(ics_data, str) else ics_data
+        content_hash = self.content_hash(data)
+        filepath = self._filepath(key)
+
+        with self._lock:
+            entry = self.events.get(key)
+            unchanged = (
+                entry is not None
+                and not entry.get('deleted_at')
+                and entry.get('hash') == content_hash
+                and ('data' in entry if not self.write_files else os.path.exists(filepath))
+            )
+            if self.write_files:
+                self._contents[key] = data
+
+            if not unchanged and self.write_files:
+                temp_path = f"{filepath}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, filepath)
+            elif not unchanged and os.path.exists(filepath):
+                # 从文件模式切换过来，删除旧文件以免与索引中的内容不一致
+                os.remove(filepath)
+
+            if (unchanged and entry.get('href') == href and entry.get('start') == start and entry.get('end') == end
+                    and entry.get('summary') == summary):
+                return key, False
+
+            self.events[key] = {
+                'uid': uid,
+                'recurrence_id': recurrence_id,
+                'hash': content_hash,
+                'file': os.path.basename(filepath),
+                'href': href,
+                'start': start,
+                'end': end,
+                'summary': summary,
+                'updated_at': time.time() if not unchanged else entry.get('updated_at')
+            }
+            if not self.write_files:
+                self.events[key]['data'] = ics_data if isinstance(ics_data, str) else data.decode('utf-8')
+            self._interval_changes.add(key)
+            self._dirty = True
+
+        return key, not unchanged
+
+    def delete(self, key: str) -> bool:
+        """删除事件文件并记录墓碑，返回事件此前是否存在"""
+
+        with self._lock:
+            entry = self.events.get(key)
+            if entry is None or entry.get('deleted_at'):
+                return False
+
+            filepath = os.path.join(self.directory, entry['file'])
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            self._contents.pop(key, None)
+            entry.pop('data', None)
+
+            entry['deleted_at'] = time.time()
+            self._interval_changes.add(key)
+            self._dirty = True
+            return True
+
+    def lookup(self, uid: str, recurrence_id: Optional[str] = None) -> Optional[Dict]:
+        """按 UID (+ RECURRENCE-ID) 查询事件索引记录，已删除的事件返回 None"""
+
+        entry = self.events.get(self.make_key(uid, recurrence_id))
+        if entry is None or entry.get('deleted_at'):
+            return None
+        return dict(entry, path=os.path.join(self.directory, entry['file']))
+
+    def get(self, uid: str, recurrence_id: Optional[str] = None) -> Optional[str]:
+        """按 UID (+ RECURRENCE-ID) 读取事件的 ICS 内容"""
+
+        key = self.make_key(uid, recurrence_id)
+        entry = self.events.get(key)
+        if entry is None or entry.get('deleted_at'):
+            return None
+        return self._read_content(key, entry)
+
+    def _read_content(self, key: str, entry: Dict) -> Optional[str]:
+        """读取事件内容：内存缓存 -> 索引中的内容 -> 事件文件，都不存在时返回 None"""
+
+        data = self._contents.get(key)
+        if data is None:
+            if 'data' in entry:
+                return entry['data']
+            filepath = os.path.join(self.directory, entry['file'])
+            if not os.path.exists(filepath):
+                return None
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            self._contents[key] = data
+        return data.decode('utf-8')
+
+    def iter_events(self) -> Iterator[Tuple[str, Dict]]:
+        """遍历未删除的事件 (事件键, 索引记录)"""
+
+        for key, entry in list(self.events.items()):
+            if not entry.get('deleted_at'):
+                yield key, entry
+
+    def iter_contents(self) -> Iterator[Tuple[str, str]]:
+        """遍历未删除事件的 (事件键, ICS 内容)，内容缺失的事件跳过"""
+
+        for key, entry in self.iter_events():
+            content = self._read_content(key, entry)
+            if content is not None:
+                yield key, content
+
+    def keys_within(self, start: int, end: int) -> List[str]:
+        """获取时间范围完全已知、且与 [start, end) 重叠的未删除事件键"""
+
+        return [
+            key for key, entry in self.iter_events()
+            if entry.get('start') is not None and entry.get('end') is not None
+            and entry['start'] < end and entry['end'] > start
+        ]
+
+    def count(self) -> int:
+        """未删除的事件数量"""
+        return sum(1 for _ in self.iter_events())
+
+    def prune_tombstones(self, older_than_seconds: float) -> int:
+        """清除超过指定时长的墓碑记录，返回清除数量"""
+
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            expired = [key for key, entry in self.events.items()
+                       if entry.get('deleted_at') and entry['deleted_at'] < cutoff]
+            for key in expired:
+                del self.events[key]
+            if expired:
+                self._dirty = True
+        return len(expired)
+
+    def query(self, start: int, end: int) -> List[IntervalHit]:
+        """查询与 [start, end) 重叠的未删除事件，按开始时间排序（使用时间区间索引，包括尚未保存的变化）
+
+        重复事件只要开始时间早于 end 即视为重叠，开始时间未知的事件不会出现在结果中。
+        """
+
+        with self._lock:
+            return self._current_intervals().query(start, end)
+
+    def _current_intervals(self) -> IntervalIndex:
+        """返回与内存中事件一致的时间区间索引（调用方持有锁）
+
+        已加载的索引或磁盘上未过期的索引只增删变化的事件；索引缺失、过期或变化过多时由全部事件重建。
+        """
+
+        intervals = self._intervals
+        if intervals is None:
+            intervals = IntervalIndex.load(self.intervals_path, newer_than=self.index_path)
+
+        if intervals is None or len(self._interval_changes) > self.INTERVAL_INCREMENTAL_LIMIT:
+            intervals = IntervalIndex.build(
+                (key, entry.get('start'), entry.get('end'), entry.get('summary'))
+                for key, entry in self.iter_events()
+            )
+        else:
+            for key in self._interval_changes:
+                intervals.discard(key)
+                entry = self.events.get(key)
+                if entry is not None and not entry.get('deleted_at'):
+                    intervals.add(key, entry.get('start'), entry.get('end'), entry.get('summary'))
+
+        self._interval_changes.clear()
+        self._intervals = intervals
+        return intervals
+
+    @classmethod
+    def load_interval_index(cls, directory: str) -> IntervalIndex:
+        """读取集合的时间区间索引而不加载事件索引；索引缺失或过期时打开事件存储重建并保存"""
+
+        intervals = IntervalIndex.load(os.path.join(directory, IntervalIndex.FILENAME),
+                                       newer_than=os.path.join(directory, cls.INDEX_FILENAME))
+        if intervals is not None:
+            return intervals
+
+        store = cls(directory)
+        with store._lock:
+            intervals = store._current_intervals()
+            intervals.save(store.intervals_path)
+        return intervals
+
+    def save(self):
+        """索引有变化时原子写入索引文件，随后更新时间区间索引"""
+
+        with self._lock:
+            if not self._dirty:
+                return
+
+            # 必须在写入事件索引之前判断磁盘上的区间索引是否过期
+            intervals_unchanged = (
+                self._intervals is None and not self._interval_changes
+                and IntervalIndex.is_fresh(self.intervals_path, self.index_path)
+            )
+            intervals = None if intervals_unchanged else self._current_intervals()
+
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'events': self.events}, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.index_path)
+            self._dirty = False
+
+            if intervals is None:
+                # 区间没有变化（如只清理了墓碑），只更新文件时间，使其仍不早于事件索引
+                os.utime(self.intervals_path)
+            else:
+                intervals.save(self.intervals_path)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP 会话管理模块
+为各同步处理器提供进程内共享的连接池会话（keep-alive、gzip 压缩、可配置超时），
+以及带指数退避重试和按服务熔断的请求封装
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+# 连接池默认参数
+DEFAULT_POOL_CONNECTIONS = 10   # 缓存的主机连接池数量
+DEFAULT_POOL_MAXSIZE = 8        # 每个主机的最大连接数
+DEFAULT_CONNECT_TIMEOUT = 5     # 建立连接的超时时间（秒）
+
+# 重试与熔断默认参数
+DEFAULT_MAX_RETRIES = 2         # 5xx / 超时 / 429 的最大重试次数
+DEFAULT_BACKOFF_BASE = 1        # 指数退避的基准等待时间（秒）
+DEFAULT_BACKOFF_MAX = 30        # 单次等待的上限（秒），Retry-After 超过该值时不再重试
+DEFAULT_FAILURE_THRESHOLD = 5   # 连续失败多少次后熔断
+DEFAULT_RESET_TIMEOUT = 60      # 熔断后多久放行一次探测请求（秒）
+
+_session = None
+_session_lock = threading.Lock()
+
+def _create_session(pool_connections: int, pool_maxsize: int) -> requests.Session:
+    """创建带连接池的 HTTP 会话"""
+
+    session = requests.Session()
+
+    # pool_block=True 保证单个主机的并发连接数不超过 pool_maxsize
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=True
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+
+    # 会话被多个账号共享，禁止保存 Cookie，避免不同账号间串用登录状态
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    return session
+
+def get_session(pool_connections: Optional[int] = None, pool_maxsize: Optional[int] = None) -> requests.Session:
+    """获取进程内共享的 HTTP 会话
+
+    首次调用时按参数创建连接池，之后的调用直接复用同一个会话。
+    认证信息需在每次请求时单独传入。
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session(
+                    int(pool_connections or DEFAULT_POOL_CONNECTIONS),
+                    int(pool_maxsize or DEFAULT_POOL_MAXSIZE)
+                )
+
+    return _session
+
+def close_session():
+    """关闭共享会话并释放连接池"""
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def resolve_timeout(config: dict, default_read_timeout: float) -> Tuple[float, float]:
+    """根据配置计算 (连接超时, 读取超时)
+
+    读取超时使用 TIMEOUT 配置项，连接超时使用 CONNECT_TIMEOUT 配置项，
+    未配置时分别使用处理器默认值和 DEFAULT_CONNECT_TIMEOUT。
+    """
+    read_timeout = float(config.get('TIMEOUT') or default_read_timeout)
+    connect_timeout = float(config.get('CONNECT_TIMEOUT') or min(DEFAULT_CONNECT_TIMEOUT, read_timeout))
+    return connect_timeout, read_timeout
+
+
+class CircuitOpenError(Exception):
+    """服务处于熔断状态，请求未发出"""
+
+class CircuitBreaker:
+    """按服务共享的熔断器
+
+    连续失败（超时、连接错误、5xx）达到阈值后进入熔断状态，之后的请求直接抛出 CircuitOpenError；
+    经过 reset_timeout 秒后只放行一个探测请求，成功则恢复，失败则重新熔断。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于熔断状态（包括等待探测结果）"""
+        return self.opened_at is not None
+
+    def before_request(self):
+        """请求前检查：熔断中且未到探测时间（或已有探测请求）时抛出 CircuitOpenError"""
+
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.time()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(
+                    f"{self.name} 服务已熔断（连续失败 {self.failures} 次），"
+                    f"{max(remaining, 0):.0f} 秒后重试"
+                )
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"✅ {self.name} 服务已恢复，解除熔断")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        """请求的结果既不算成功也不算失败（如超时后由调用方拆分重试）时调用：不计数，只允许下一次探测"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    print(f"⚡ {self.name} 服务连续失败 {self.failures} 次，熔断 {self.reset_timeout:g} 秒")
+                self.opened_at = time.time()
+            self._probing = False
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str, failure_threshold: Optional[int] = None,
+                        reset_timeout: Optional[float] = None) -> CircuitBreaker:
+    """获取指定服务的熔断器（进程内共享，首次调用时按参数创建）"""
+
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                int(failure_threshold or DEFAULT_FAILURE_THRESHOLD),
+                float(reset_timeout or DEFAULT_RESET_TIMEOUT)
+            )
+        return _breakers[name]
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回等待秒数，无法解析时返回 None"""
+
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def is_timeout_error(error: Exception) -> bool:
+    """是否为超时错误（流式读取中的读超时以 ConnectionError 的形式抛出）"""
+    return isinstance(error, Timeout) or (
+        isinstance(error, RequestsConnectionError) and 'timed out' in str(error).lower()
+    )
+
+def request_with_retry(session: requests.Session, method: str, url: str,
+                       breaker: Optional[CircuitBreaker] = None,
+                       max_retries: int = DEFAULT_MAX_RETRIES,
+                       backoff_base: float = DEFAULT_BACKOFF_BASE,
+                       backoff_max: float = DEFAULT_BACKOFF_MAX,
+                       retry_on_timeout: bool = True,
+                       **kwargs) -> requests.Response:
+    """发送请求，5xx、超时和连接错误时按指数退避（全抖动）重试，429 / 503 优先遵守 Retry-After
+
+    重试次数用完后返回最后一个响应或重新抛出最后一个异常；Retry-After 超过 backoff_max 时直接返回响应。
+    retry_on_timeout=False 时超时不重试也不计入熔断，交给调用方处理（如拆分时间范围）。
+    breaker 记录每次请求的结果，熔断期间抛出 CircuitOpenError 而不发出请求。
+    """
+
+    for attempt in range(max_retries + 1):
+        if breaker is not None:
+            breaker.before_request()
+
+        try:
+            response = session.request(method, url, **kwargs)
+        except (Timeout, RequestsConnectionError) as e:
+            if not retry_on_timeout and is_timeout_error(e):
+                # 调用方会拆分后重试（请求范围过大，而不是服务故障），不计入熔断
+                if breaker is not None:
+                    breaker.release_probe()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+            print(f"请求异常: {e}，{delay:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            continue
+        except Exception:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+
+        # 429 说明服务仍在正常响应，只是限流，不计入熔断
+        status = response.status_code
+        if breaker is not None:
+            if status < 500:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        if status < 500 and status != 429:
+            return response
+        if attempt >= max_retries:
+            return response
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if status in (429, 503) else None
+        if retry_after is not None and retry_after > backoff_max:
+            print(f"HTTP {status}，服务要求 {retry_after:.0f} 秒后重试，超过等待上限，放弃重试")
+            return response
+        delay = retry_after if retry_after is not None else random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+        print(f"HTTP {status}，{delay:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
+        response.close()
+        time.sleep(delay)
@@ -8,16 +8,33 @@ ICS 文件合并工具
 
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Set
-import re
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Union
+from event_record import EventRecord, parse_vevents
+from event_store import EventStore
+from ics_writer import ICSStreamWriter
+from providers import get_provider_label, get_provider_types
 
 class ICSMerger:
-    """ICS 文件合并处理器"""
+    """ICS 文件合并处理器
 
-    def __init__(self, temp_dir: str = "temp", public_dir: str = "public"):
+    合并的来源可以是事件目录中的 ICS 文件，也可以是事件存储（EventStore）：
+    event_files=False（事件不写单独的文件）或调用方传入非空的已打开事件存储时，直接从事件存储读取事件内容，
+    同步处理器刚写入的事件在内存中交给合并，不再逐个读取事件文件。
+    解析出的每个 VEVENT 都保存为紧凑的 EventRecord，去重索引中只保留记录，不再保留组件文本。
+    """
+
+    def __init__(self, temp_dir: str = "temp", public_dir: str = "public",
+                 parallel_threshold: int = 2000, max_workers: Optional[int] = None,
+                 event_files: bool = True):
         self.temp_dir = temp_dir
         self.public_dir = public_dir
+        self.event_files = event_files
+
+        # 源文件数量达到阈值时使用进程池并行解析
+        self.parallel_threshold = parallel_threshold
+        self.max_workers = max_workers
 
         # 创建目录
         os.makedirs(self.temp_dir, exist_ok=True)
@@ -30,23 +47,73 @@ class ICSMerger:
             with open(filepath, 'r', encoding='utf-8') as f:
                 content = f.read()
 
-            # 提取VEVENT部分
-            vevent_pattern = r'BEGIN:VEVENT.*?END:VEVENT'
-            vevents = re.findall(vevent_pattern, content, re.DOTALL)
+            return self.parse_ics_content(content, filepath)
+
+        except Exception as e:
+            print(f"解析ICS文件失败 {filepath}: {e}")
+            return {'vevents': [], 'vtimezones': {}, 'filepath': filepath}
+
+    def parse_ics_content(self, content: str, source: str) -> Dict:
+        """从ICS文本中提取VEVENT记录和VTIMEZONE文本（{TZID: 文本}）"""
 
-            # 提取VTIMEZONE部分（如果存在）
-            vtimezone_pattern = r'BEGIN:VTIMEZONE.*?END:VTIMEZONE'
-            vtimezones = re.findall(vtimezone_pattern, content, re.DOTALL)
+        vevents, vtimezones = parse_vevents(content)
+        return {
+            'vevents': vevents,
+            'vtimezones': vtimezones,
+            'filepath': source
+        }
 
-            return {
-                'vevents': vevents,
-                'vtimezones': vtimezones,
-                'filepath': filepath
-            }
+    def parse_event_store(self, store: EventStore) -> Dict:
+        """解析事件存储中的所有事件（内容优先取自内存和索引），合并为一个解析结果"""
 
+        vevents = []
+        vtimezones = {}
+        try:
+            for _, content in store.iter_contents():
+                parsed = self.parse_ics_content(content, store.directory)
+                vevents.extend(parsed['vevents'])
+                for tzid, vtimezone in parsed['vtimezones'].items():
+                    vtimezones.setdefault(tzid, vtimezone)
         except Exception as e:
-            print(f"解析ICS文件失败 {filepath}: {e}")
-            return {'vevents': [], 'vtimezones': [], 'filepath': filepath}
+            print(f"读取事件存储失败 {store.directory}: {e}")
+
+        return {'vevents': vevents, 'vtimezones': vtimezones, 'filepath': store.directory}
+
+    def collect_event_stores_by_type(self, account_type: str,
+                                     event_stores: Optional[Dict[str, EventStore]] = None) -> List[EventStore]:
+        """收集指定账号类型的所有事件存储
+
+        event_stores 为 {目录: 已打开的事件存储}，命中的目录直接使用内存中的实例，其余从磁盘加载索引。
+        """
+
+        if account_type.lower() not in get_provider_types():
+            print(f"不支持的账号类型: {account_type}")
+            return []
+
+        event_stores = {os.path.normpath(directory): store for directory, store in (event_stores or {}).items()}
+        stores = []
+        in_memory = 0
+        for index_file in sorted(glob.glob(os.path.join(f"{account_type.lower()}_events_*", "*", EventStore.INDEX_FILENAME))):
+            directory = os.path.normpath(os.path.dirname(index_file))
+            if directory in event_stores:
+                stores.append(event_stores[directory])
+                in_memory += 1
+            else:
+                stores.append(EventStore(directory, write_files=self.event_files))
+
+        print(f"找到 {len(stores)} 个 {account_type} 事件集合（{in_memory} 个直接使用内存中的事件）")
+        return stores
+
+    def collect_sources_by_type(self, account_type: str,
+                                event_stores: Optional[Dict[str, EventStore]] = None) -> List[Union[str, EventStore]]:
+        """收集指定账号类型的合并来源：传入非空的事件存储或不写事件文件时为事件存储，否则为ICS文件
+
+        没有已打开的事件存储（如单独运行 --merge-type / --merge-all）时按文件合并，文件较多时可以使用进程池。
+        """
+
+        if event_stores or not self.event_files:
+            return self.collect_event_stores_by_type(account_type, event_stores)
+        return self.collect_ics_files_by_type(account_type)
 
     def collect_ics_files_by_type(self, account_type: str) -> List[str]:
         """收集指定账号类型的所有ICS文件"""
@@ -54,15 +121,11 @@ class ICSMerger:
         ics_files = []
 
         # 根据账号类型查找对应的目录
-        if account_type.lower() == 'dingtalk':
-            pattern = "dingtalk_events_*/*/*.ics"
-        elif account_type.lower() == 'tencent':
-            pattern = "tencent_events_*/*/*.ics"
-        else:
+        if account_type.lower() not in get_provider_types():
             print(f"不支持的账号类型: {account_type}")
             return []
 
-        ics_files = glob.glob(pattern)
+        ics_files = glob.glob(f"{account_type.lower()}_events_*/*/*.ics")
         print(f"找到 {len(ics_files)} 个 {account_type} ICS 文件")
 
         return ics_files
@@ -71,153 +134,262 @@ class ICSMerger:
         """收集所有ICS文件"""
 
         ics_files = []
+        counts = {}
 
-        # 收集钉钉文件
-        dingtalk_files = glob.glob("dingtalk_events_*/*/*.ics")
-        ics_files.extend(dingtalk_files)
-
-        # 收集腾讯会议文件
-        tencent_files = glob.glob("tencent_events_*/*/*.ics")
-        ics_files.extend(tencent_files)
+        # 按注册的账号类型收集文件
+        for account_type in get_provider_types():
+            type_files = glob.glob(f"{account_type}_events_*/*/*.ics")
+            ics_files.extend(type_files)
+            counts[account_type] = len(type_files)
 
         print(f"总共找到 {len(ics_files)} 个 ICS 文件")
-        print(f"  - 钉钉: {len(dingtalk_files)} 个")
-        print(f"  - 腾讯会议: {len(tencent_files)} 个")
+        for account_type, count in counts.items():
+            if count:
+                print(f"  - {get_provider_label(account_type)}: {count} 个")
 
         return ics_files
 
-    def merge_ics_files(self, ics_files: List[str], output_filename: str, calendar_name: str = "合并日历") -> str:
-        """合并多个ICS文件为一个"""
+    def merge_ics_files(self, ics_files: List[Union[str, EventStore]], output_filename: str, calendar_name: str = "合并日历") -> str:
+        """合并多个ICS文件（或事件存储）为一个"""
 
         if not ics_files:
             print("没有ICS文件需要合并")
             return ""
 
-        print(f"开始合并 {len(ics_files)} 个ICS文件...")
+        print(f"开始合并 {len(ics_files)} 个来源...")
 
-        all_vevents = []
-        all_vtimezones = set()  # 使用set避免重复
+        target = self.new_merge_target()
+        for parsed in self.iter_parsed_files(ics_files):
+            self.add_parsed_file(target, parsed)
 
-        # 解析所有ICS文件
-        for ics_file in ics_files:
-            parsed = self.parse_ics_file(ics_file)
-            all_vevents.extend(parsed['vevents'])
-            all_vtimezones.update(parsed['vtimezones'])
+        return self.write_merge_target(target, output_filename, calendar_name)
 
-        # 生成合并后的ICS内容
-        merged_content = self.generate_merged_ics(
-            list(all_vtimezones),
-            all_vevents,
-            calendar_name
-        )
+    def iter_parsed_files(self, ics_files: List[Union[str, EventStore]]) -> Iterator[Dict]:
+        """按顺序解析ICS文件（或事件存储），文件数量较多时使用进程池并行解析"""
 
-        # 保存合并文件
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            f.write(merged_content)
+        if any(isinstance(source, EventStore) for source in ics_files):
+            for source in ics_files:
+                yield self.parse_event_store(source) if isinstance(source, EventStore) else self.parse_ics_file(source)
+            return
 
-        print(f"✅ 合并完成: {output_filename}")
-        print(f"   - 事件数量: {len(all_vevents)}")
-        print(f"   - 时区数量: {len(all_vtimezones)}")
+        if len(ics_files) < self.parallel_threshold or self.max_workers == 1:
+            for ics_file in ics_files:
+                yield self.parse_ics_file(ics_file)
+            return
 
-        return output_filename
+        print(f"使用进程池并行解析 {len(ics_files)} 个ICS文件...")
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from executor.map(self.parse_ics_file, ics_files, chunksize=64)
 
-    def generate_merged_ics(self, vtimezones: List[str], vevents: List[str], calendar_name: str) -> str:
-        """生成合并后的ICS文件内容"""
+    def new_merge_target(self) -> Dict:
+        """创建一个合并输出的事件索引"""
 
-        timestamp = datetime.now().strftime("%Y%m%dT%H%M%SZ")
+        return {
+            'event_index': {},      # (UID, RECURRENCE-ID) -> EventRecord，同一事件只保留最新版本
+            'vtimezones': {},       # TZID -> VTIMEZONE 文本，同一 TZID 只保留第一个定义（RFC 5545 不允许重复的 TZID）
+            'total_vevents': 0
+        }
 
-        # ICS文件头部
-        ics_content = [
-            "BEGIN:VCALENDAR",
-            "VERSION:2.0",
-            "PRODID:-//CalDAV Sync Tool//CalDAV Sync Tool v3//CN",
-            f"X-WR-CALNAME:{calendar_name}",
-            f"X-WR-CALDESC:由 CalDAV 同步工具合并生成",
-            "CALSCALE:GREGORIAN",
-            "METHOD:PUBLISH"
-        ]
+    def add_parsed_file(self, target: Dict, parsed: Dict):
+        """把解析后的ICS文件加入合并输出"""
 
-        # 添加时区信息
-        for vtimezone in vtimezones:
-            ics_content.append(vtimezone)
+        for vevent in parsed['vevents']:
+            target['total_vevents'] += 1
+            self.index_vevent(target['event_index'], vevent)
+        for tzid, vtimezone in parsed['vtimezones'].items():
+            target['vtimezones'].setdefault(tzid, vtimezone)
 
-        # 添加事件
-        for vevent in vevents:
-            ics_content.append(vevent)
+    def write_merge_target(self, target: Dict, output_filename: str, calendar_name: str) -> str:
+        """把合并输出写入文件"""
 
-        # ICS文件尾部
-        ics_content.append("END:VCALENDAR")
+        event_index = target['event_index']
+        all_vtimezones = target['vtimezones']
 
-        return "\n".join(ics_content)
+        # 按固定顺序流式写出，内容不变时输出字节完全一致，发布时可跳过替换
+        ordered_keys = sorted(event_index, key=lambda key: (key[0] or '', key[1] or ''))
+        self.write_merged_ics(
+            output_filename,
+            (all_vtimezones[tzid] for tzid in sorted(all_vtimezones)),
+            (event_index[key] for key in ordered_keys),
+            calendar_name
+        )
 
-    def merge_by_account_type(self, account_type: str, custom_filename: str = None) -> str:
+        print(f"✅ 合并完成: {output_filename}")
+        print(f"   - 事件数量: {len(event_index)}（去除重复 {target['total_vevents'] - len(event_index)} 个）")
+        print(f"   - 时区数量: {len(all_vtimezones)}")
+
+        return output_filename
+
+    def index_vevent(self, event_index: Dict, vevent: EventRecord):
+        """把 VEVENT 记录加入事件索引，同一 UID/RECURRENCE-ID 只保留 SEQUENCE、LAST-MODIFIED 最新的版本"""
+
+        # 没有 UID 的事件无法识别身份，只去除内容完全相同的副本
+        key = vevent.identity
+        existing = event_index.get(key)
+        if existing is None or vevent.version > existing.version:
+            event_index[key] = vevent
+
+    def write_merged_ics(self, output_filename: str, vtimezones: Iterable[str], vevents: Iterable[EventRecord], calendar_name: str):
+        """流式写出合并后的ICS文件（CRLF 行尾、RFC 5545 折行），写完后原子发布，内容未变化时保留原文件"""
+
+        with ICSStreamWriter(output_filename) as writer:
+            # ICS文件头部
+            writer.write_lines([
+                "BEGIN:VCALENDAR",
+                "VERSION:2.0",
+                "PRODID:-//CalDAV Sync Tool//CalDAV Sync Tool v3//CN",
+                f"X-WR-CALNAME:{calendar_name}",
+                f"X-WR-CALDESC:由 CalDAV 同步工具合并生成",
+                "CALSCALE:GREGORIAN",
+                "METHOD:PUBLISH"
+            ])
+
+            # 添加时区信息
+            for vtimezone in vtimezones:
+                writer.write_component(vtimezone)
+
+            # 添加事件
+            for vevent in vevents:
+                writer.write_unfolded(vevent.raw)
+
+            # ICS文件尾部
+            writer.write_line("END:VCALENDAR")
+
+        if writer.changed:
+            print(f"已发布新版本: {output_filename}")
+        else:
+            print(f"内容未变化，保留现有文件: {output_filename}")
+
+    def merge_by_account_type(self, account_type: str, custom_filename: str = None,
+                              event_stores: Optional[Dict[str, EventStore]] = None) -> str:
         """按账号类型合并ICS文件"""
 
         print(f"\n=== 按账号类型合并: {account_type} ===")
 
-        # 收集指定类型的ICS文件
-        ics_files = self.collect_ics_files_by_type(account_type)
+        # 收集指定类型的ICS文件（或事件存储）
+        ics_files = self.collect_sources_by_type(account_type, event_stores)
 
         if not ics_files:
             print(f"未找到 {account_type} 类型的ICS文件")
             return ""
 
-        # 清理同类型的旧文件
-        self.cleanup_public_files(f"{account_type}_*.ics")
-
         # 生成输出文件名
-        if custom_filename:
-            filename_part = custom_filename
-        else:
-            filename_part = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_filename = self.get_output_filename(account_type, custom_filename)
 
-        output_filename = os.path.join(self.public_dir, f"{account_type}_{filename_part}.ics")
-
-        # 合并文件
-        return self.merge_ics_files(
+        # 合并文件（原子发布，发布期间旧文件始终可访问）
+        merged_file = self.merge_ics_files(
             ics_files,
             output_filename,
             f"{account_type.upper()} 合并日历"
         )
 
-    def merge_all_accounts(self, custom_filename: str = None) -> str:
+        # 发布完成后再清理同类型的旧版本
+        self.cleanup_public_files(f"{account_type}_*.ics", keep=merged_file)
+
+        return merged_file
+
+    def merge_all_accounts(self, custom_filename: str = None,
+                           event_stores: Optional[Dict[str, EventStore]] = None) -> str:
         """合并所有账号的ICS文件"""
 
         print(f"\n=== 合并所有账号 ===")
 
-        # 收集所有ICS文件
-        ics_files = self.collect_all_ics_files()
+        # 收集所有ICS文件（或事件存储）
+        if event_stores or not self.event_files:
+            ics_files = [store for account_type in get_provider_types()
+                         for store in self.collect_event_stores_by_type(account_type, event_stores)]
+        else:
+            ics_files = self.collect_all_ics_files()
 
         if not ics_files:
             print("未找到任何ICS文件")
             return ""
 
-        # 清理 public 目录中的旧文件
-        self.cleanup_public_files("all_calendars_*.ics")
-
         # 生成输出文件名
-        if custom_filename:
-            filename_part = custom_filename
-        else:
-            filename_part = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        output_filename = os.path.join(self.public_dir, f"all_calendars_{filename_part}.ics")
+        output_filename = self.get_output_filename("all_calendars", custom_filename)
 
-        # 合并文件
-        return self.merge_ics_files(
+        # 合并文件（原子发布，发布期间旧文件始终可访问）
+        merged_file = self.merge_ics_files(
             ics_files,
             output_filename,
             "所有日历合并"
         )
 
-    def cleanup_public_files(self, pattern: str):
-        """清理 public 目录中符合特定模式的旧 ICS 文件"""
+        # 发布完成后再清理 public 目录中的旧版本
+        self.cleanup_public_files("all_calendars_*.ics", keep=merged_file)
+
+        return merged_file
+
+    def merge_outputs(self, account_types: List[str], custom_filename: str = None, include_all: bool = True,
+                      event_stores: Optional[Dict[str, EventStore]] = None) -> Dict[str, str]:
+        """单次解析所有源文件，同时生成各账号类型的合并文件和全局合并文件
+
+        每个源文件只读取和解析一次，解析结果同时分发到所属类型的输出和全局输出。
+        传入非空的 event_stores 时以事件存储为来源，其中已打开的实例直接使用内存中的事件。
+        返回 {账号类型 或 'all': 合并文件路径}，没有源文件的输出对应空字符串。
+        """
+
+        print(f"\n=== 单次遍历合并: {', '.join(account_types)}{' + 全局' if include_all else ''} ===")
+
+        files_by_type = {account_type: self.collect_sources_by_type(account_type, event_stores) for account_type in account_types}
+        sources = [(account_type, ics_file) for account_type, files in files_by_type.items() for ics_file in files]
+
+        results = {account_type: "" for account_type in account_types}
+        if include_all:
+            results['all'] = ""
+
+        if not sources:
+            print("未找到任何ICS文件")
+            return results
+
+        print(f"开始解析 {len(sources)} 个来源...")
+
+        targets = {account_type: self.new_merge_target() for account_type, files in files_by_type.items() if files}
+        if include_all:
+            targets['all'] = self.new_merge_target()
+
+        parsed_files = self.iter_parsed_files([ics_file for _, ics_file in sources])
+        for (account_type, _), parsed in zip(sources, parsed_files):
+            self.add_parsed_file(targets[account_type], parsed)
+            if include_all:
+                self.add_parsed_file(targets['all'], parsed)
+
+        for name, target in targets.items():
+            if name == 'all':
+                prefix = "all_calendars"
+                calendar_name = "所有日历合并"
+            else:
+                prefix = name
+                calendar_name = f"{name.upper()} 合并日历"
+
+            output_filename = self.get_output_filename(prefix, custom_filename)
+            results[name] = self.write_merge_target(target, output_filename, calendar_name)
+
+            # 发布完成后再清理旧版本
+            self.cleanup_public_files(f"{prefix}_*.ics", keep=results[name])
+
+        return results
+
+    def get_output_filename(self, prefix: str, custom_filename: str = None) -> str:
+        """生成 public 目录中的合并文件路径，未指定自定义名称时使用时间戳"""
+
+        if custom_filename:
+            filename_part = custom_filename
+        else:
+            filename_part = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        return os.path.join(self.public_dir, f"{prefix}_{filename_part}.ics")
+
+    def cleanup_public_files(self, pattern: str, keep: Optional[str] = None):
+        """清理 public 目录中符合特定模式的旧 ICS 文件，keep 指定的文件（当前发布版本）除外"""
 
         print(f"=== 清理 public 目录中的旧文件 (模式: {pattern}) ===")
 
         # 查找所有匹配的文件
         search_pattern = os.path.join(self.public_dir, pattern)
         existing_files = glob.glob(search_pattern)
+        if keep:
+            existing_files = [path for path in existing_files if os.path.abspath(path) != os.path.abspath(keep)]
 
         if existing_files:
             print(f"找到 {len(existing_files)} 个现有文件，准备清理...")
@@ -261,7 +433,9 @@ class ICSMerger:
                     print(f"删除文件失败 {temp_file}: {e}")
 
         # 清理事件下载目录
-        event_dirs = glob.glob("dingtalk_events_*") + glob.glob("tencent_events_*")
+        event_dirs = []
+        for account_type in get_provider_types():
+            event_dirs.extend(glob.glob(f"{account_type}_events_*"))
         for event_dir in event_dirs:
             if os.path.isdir(event_dir):
                 dir_age = current_time - os.path.getmtime(event_dir)
@@ -273,7 +447,14 @@ class ICSMerger:
                     except Exception as e:
                         print(f"删除目录失败 {event_dir}: {e}")
 
-        print(f"清理完成，删除了 {cleaned_files} 个临时文件，{cleaned_dirs} 个事件目录")
+        # 清理事件存储中过期的墓碑记录
+        pruned_tombstones = 0
+        for index_file in glob.glob(os.path.join("*_events_*", "*", EventStore.INDEX_FILENAME)):
+            store = EventStore(os.path.dirname(index_file))
+            pruned_tombstones += store.prune_tombstones(older_than_days * 24 * 3600)
+            store.save()
+
+        print(f"清理完成，删除了 {cleaned_files} 个临时文件，{cleaned_dirs} 个事件目录，{pruned_tombstones} 条墓碑记录")
 
 def main():
     """独立运行测试"""
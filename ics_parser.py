@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ICS 解析模块
+按行扫描 iCalendar 文本（RFC 5545）：展开折行、解析属性参数，按需逐个产出组件。
+同步处理器和合并工具共用，替代整文件正则匹配和按换行符的简单拆分
+"""
+
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+# 参数: ;NAME=值[,值...]，值可以用双引号包裹（其中的 ; : , 不是分隔符）
+_PARAM_PATTERN = re.compile(r';([^=;:]+)=((?:"[^"]*"|[^";:,]*)(?:,(?:"[^"]*"|[^";:,]*))*)')
+# 组件边界: BEGIN / END 行（不区分大小写）；以换行符开头而不用 ^ 锚点，搜索时可以快速跳过其他字符
+_MARKER_PATTERN = re.compile(r'\n(BEGIN|END):([^\n]*)', re.IGNORECASE)
+# TEXT 类型值中的转义序列（RFC 5545 3.3.11）
+_TEXT_ESCAPE_PATTERN = re.compile(r'\\([\\;,nN])')
+# DATE / DATE-TIME 值（RFC 5545 3.3.4 / 3.3.5）
+_DATE_PATTERN = re.compile(r'(\d{4})(\d{2})(\d{2})$')
+_DATETIME_PATTERN = re.compile(r'(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})')
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+class ContentLine(NamedTuple):
+    """一个逻辑行：属性名（大写）、参数（参数名大写 -> 去掉引号的值，多个值以逗号连接）和原始值"""
+    name: str
+    params: Dict[str, str]
+    value: str
+
+def unfold(text: str) -> str:
+    """展开折行（合并以空格或制表符开头的续行），行尾统一为 \\n
+
+    整段文本的替换都在 C 层完成，比逐行拼接快得多。
+    """
+
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    return text.replace('\n ', '').replace('\n\t', '')
+
+def unfold_lines(text: str) -> List[str]:
+    """把文本拆分为逻辑行并去掉空行（只按换行符拆分，避免把属性值中的其他 Unicode 分隔符当作行尾）"""
+    return [line for line in unfold(text).split('\n') if line]
+
+def parse_content_line(line: str) -> ContentLine:
+    """解析一个逻辑行，没有冒号的行视为值为空"""
+
+    colon = line.find(':')
+    semicolon = line.find(';')
+
+    # 常见情况：没有参数，直接按第一个冒号拆分
+    if semicolon == -1 or (colon != -1 and colon < semicolon):
+        if colon == -1:
+            return ContentLine(line.strip().upper(), {}, '')
+        return ContentLine(line[:colon].strip().upper(), {}, line[colon + 1:])
+
+    params = {}
+    # 参数中没有引号时第一个冒号就是值的开始，按分号拆分参数即可，不必逐个正则匹配
+    if colon != -1 and '"' not in line[semicolon:colon]:
+        for param in line[semicolon + 1:colon].split(';'):
+            param_name, separator, param_value = param.partition('=')
+            if separator and param_name.strip():
+                params[param_name.strip().upper()] = param_value
+        return ContentLine(line[:semicolon].strip().upper(), params, line[colon + 1:])
+
+    position = semicolon
+    while True:
+        match = _PARAM_PATTERN.match(line, position)
+        if match is None:
+            break
+        params[match.group(1).strip().upper()] = match.group(2).replace('"', '')
+        position = match.end()
+
+    value_start = line.find(':', position)
+    value = line[value_start + 1:] if value_start != -1 else ''
+    return ContentLine(line[:semicolon].strip().upper(), params, value)
+
+def content_line_value(line: str) -> str:
+    """只取逻辑行的值（不解析参数），参数中没有引号时直接按第一个冒号截取"""
+
+    colon = line.find(':')
+    if colon != -1 and '"' not in line[:colon]:
+        return line[colon + 1:]
+    return parse_content_line(line).value
+
+def unescape_text(value: str) -> str:
+    """还原 TEXT 类型值中的转义字符（\\n、\\,、\\;、\\\\）"""
+    if '\\' not in value:
+        return value
+    return _TEXT_ESCAPE_PATTERN.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+def parse_ics_timestamp(value: Optional[str]) -> Optional[int]:
+    """把 DTSTART / DTEND 的值转换为 UTC 时间戳（秒）
+
+    带 TZID 的本地时间和浮动时间按 UTC 近似处理（误差不超过一天），无法解析时返回 None。
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    # 按位置截取数字，比 strptime 快一个数量级（解析大量事件时是主要开销）
+    match = (_DATE_PATTERN if len(value) == 8 else _DATETIME_PATTERN).match(value)
+    if match is None:
+        return None
+    try:
+        # 构造 datetime 同时校验日期和时间是否合法
+        moment = datetime(*map(int, match.groups()))
+    except ValueError:
+        return None
+    return (moment - _EPOCH) // _SECOND
+
+@lru_cache(maxsize=None)
+def _property_pattern(name: str):
+    """匹配指定名称属性行的正则（名称不区分大小写）"""
+    return re.compile(rf'^{re.escape(name)}[;:][^\n]*', re.IGNORECASE | re.MULTILINE)
+
+class Component:
+    """一个日历组件（如 VEVENT、VTIMEZONE）
+
+    text 为组件展开折行后的文本（包括 BEGIN / END 和嵌套的子组件），own_text 为组件自身的属性行。
+    逻辑行和属性都在首次访问时才拆分和解析，且只解析被访问的名称（VALARM 等子组件中的同名属性不会混入）。
+    """
+
+    __slots__ = ('name', 'text', 'own_text', '_properties')
+
+    def __init__(self, name: str, text: str, own_text: str):
+        self.name = name
+        self.text = text
+        self.own_text = own_text
+        self._properties = None
+
+    @property
+    def lines(self) -> List[str]:
+        """组件的逻辑行"""
+        return [line for line in self.text.split('\n') if line]
+
+    @property
+    def own_lines(self) -> List[str]:
+        """组件自身的属性行（不含 BEGIN / END 和子组件）"""
+        return [line for line in self.own_text.split('\n') if line]
+
+    @property
+    def properties(self) -> List[ContentLine]:
+        """组件自身的所有属性"""
+        if self._properties is None:
+            self._properties = [parse_content_line(line) for line in self.own_lines]
+        return self._properties
+
+    def get_all(self, name: str) -> List[ContentLine]:
+        """获取所有指定名称的属性（只解析名称匹配的行）"""
+        return [parse_content_line(line) for line in _property_pattern(name.upper()).findall(self.own_text)]
+
+    def get(self, name: str) -> Optional[ContentLine]:
+        """获取第一个指定名称的属性"""
+        match = _property_pattern(name.upper()).search(self.own_text)
+        return parse_content_line(match.group()) if match else None
+
+    def get_first_lines(self, names: Iterable[str]) -> Dict[str, str]:
+        """一次遍历获取多个名称各自的第一个属性行，返回 {属性名（大写）: 逻辑行}，不存在的名称不出现在结果中
+
+        需要同时读取多个属性时比逐个调用 get_value（每个名称一次正则搜索）快；
+        只返回原始行，由调用方决定是否解析参数。传入大写名称的 frozenset 时直接使用，不再逐次转换。
+        """
+
+        wanted = names if isinstance(names, frozenset) else {name.upper() for name in names}
+        found = {}
+        for line in self.own_text.split('\n'):
+            colon = line.find(':')
+            semicolon = line.find(';')
+            end = colon if semicolon == -1 or (colon != -1 and colon < semicolon) else semicolon
+            if end == -1:
+                continue
+            name = line[:end].strip().upper()
+            if name in wanted and name not in found:
+                found[name] = line
+        return found
+
+    def get_value(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """获取第一个指定名称的属性值（去掉首尾空白）"""
+
+        match = _property_pattern(name.upper()).search(self.own_text)
+        if match is None:
+            return default
+        return content_line_value(match.group()).strip()
+
+def iter_components(text: str, names: Optional[Iterable[str]] = None) -> Iterator[Component]:
+    """按顺序逐个产出 VCALENDAR 下的组件，names 指定时只产出这些类型的组件
+
+    只扫描 BEGIN / END 行来确定组件边界，属性行在组件被访问时才处理。
+    不在 VCALENDAR 中的组件（如单独保存的 VEVENT 文本）同样会被产出。
+    """
+
+    # 在开头补一个换行符，使第一行也能匹配边界
+    text = '\n' + unfold(text)
+    wanted = {name.upper() for name in names} if names is not None else None
+    depth = 0
+    start = own_start = 0
+    current_name = None
+    own_parts = []
+
+    for marker in _MARKER_PATTERN.finditer(text):
+        component_name = marker.group(2).strip().upper()
+
+        if marker.group(1).upper() == 'BEGIN':
+            if depth == 0:
+                if component_name == 'VCALENDAR':
+                    continue
+                start = marker.start() + 1
+                own_start = marker.end() + 1
+                current_name = component_name
+                own_parts = []
+            elif depth == 1:
+                # 子组件开始：之前的行属于组件自身
+                own_parts.append(text[own_start:marker.start()])
+            depth += 1
+            continue
+
+        if depth == 0:
+            # END:VCALENDAR 或多余的 END 行
+            continue
+        depth -= 1
+        if depth == 1:
+            own_start = marker.end() + 1
+        elif depth == 0 and (wanted is None or current_name in wanted):
+            own_parts.append(text[own_start:marker.start()])
+            yield Component(current_name, text[start:marker.end()], '\n'.join(own_parts))
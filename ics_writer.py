@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ICS 流式写出模块
+逐个组件写出日历文件：CRLF 行尾、RFC 5545 折行，先写临时文件再原子发布
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Iterable
+
+from ics_parser import unfold_lines
+
+# RFC 5545 3.1: 每行不超过 75 字节（不含换行符）
+MAX_LINE_OCTETS = 75
+
+def _default_file_mode() -> int:
+    """普通 open() 新建文件时的权限（0666 去掉 umask）；umask 只能先设置再恢复，因此只在导入时读取一次"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+_DEFAULT_FILE_MODE = _default_file_mode()
+
+def fold_line(line: str) -> bytes:
+    """把逻辑行编码为 UTF-8 并按 75 字节折行，不拆分多字节字符，返回带 CRLF 的字节串"""
+    return fold_bytes(line.encode('utf-8'))
+
+def fold_bytes(data: bytes) -> bytes:
+    """把 UTF-8 编码的逻辑行按 75 字节折行，不拆分多字节字符，返回带 CRLF 的字节串"""
+
+    if len(data) <= MAX_LINE_OCTETS:
+        return data + b'\r\n'
+
+    parts = []
+    start = 0
+    limit = MAX_LINE_OCTETS
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # 回退到 UTF-8 字符边界（续字节形如 0b10xxxxxx）
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end])
+        start = end
+        # 续行以一个空格开头，占用 1 字节
+        limit = MAX_LINE_OCTETS - 1
+
+    return b'\r\n '.join(parts) + b'\r\n'
+
+def file_sha256(filepath: str) -> str:
+    """分块计算文件的 SHA-256"""
+
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fsync_directory(directory: str):
+    """同步目录项，确保重命名在断电后仍然生效（不支持的平台上忽略）"""
+
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class ICSStreamWriter:
+    """ICS 流式写出器
+
+    内容先写入目标目录下的隐藏临时文件，commit() 时 fsync 并原子重命名为目标文件；
+    内容哈希与现有目标文件一致时不重命名，保持目标文件不变（CDN / 浏览器缓存继续有效）。
+    发生异常时删除临时文件，目标文件保持不变。可作为上下文管理器使用。
+    """
+
+    def __init__(self, output_filename: str):
+        self.output_filename = output_filename
+        output_dir = os.path.dirname(output_filename) or '.'
+        os.makedirs(output_dir, exist_ok=True)
+
+        fd, self.temp_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(output_filename)}.", suffix='.tmp', dir=output_dir
+        )
+        self._file = os.fdopen(fd, 'wb')
+        self._digest = hashlib.sha256()
+        self.changed = False
+
+    def write_line(self, line: str):
+        """写出一个逻辑行（自动折行）"""
+        self._write(fold_line(line))
+
+    def _write(self, data: bytes):
+        self._digest.update(data)
+        self._file.write(data)
+
+    def write_lines(self, lines: Iterable[str]):
+        """写出多个逻辑行"""
+        for line in lines:
+            self.write_line(line)
+
+    def write_component(self, component: str):
+        """写出一个组件（如 VEVENT、VTIMEZONE），先展开原有折行再按规范重新折行"""
+        self.write_lines(unfold_lines(component))
+
+    def write_unfolded(self, data: bytes):
+        """写出已展开折行、以 \\n 分隔的 UTF-8 组件内容（如 EventRecord.raw），不再解码为文本"""
+        for line in data.split(b'\n'):
+            if line:
+                self._write(fold_bytes(line))
+
+    def commit(self) -> str:
+        """落盘临时文件并发布：内容有变化时原子替换目标文件，否则丢弃临时文件"""
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        # mkstemp 创建的临时文件权限为 0600，发布时使用目标文件原有的权限（新文件按 umask），保证静态站点可读；
+        # 目标文件恰为 0600 时视为此前直接发布临时文件留下的权限，同样按 umask 恢复
+        try:
+            current_mode = os.stat(self.output_filename).st_mode & 0o7777
+        except OSError:
+            current_mode = None
+        mode = _DEFAULT_FILE_MODE if current_mode in (None, 0o600) else current_mode
+
+        if current_mode is not None and file_sha256(self.output_filename) == self._digest.hexdigest():
+            os.remove(self.temp_path)
+            if current_mode != mode:
+                os.chmod(self.output_filename, mode)
+            self.changed = False
+        else:
+            os.chmod(self.temp_path, mode)
+            os.replace(self.temp_path, self.output_filename)
+            fsync_directory(os.path.dirname(self.output_filename) or '.')
+            self.changed = True
+
+        return self.output_filename
+
+    def abort(self):
+        """放弃写出，删除临时文件"""
+
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
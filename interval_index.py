@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件时间区间索引
+按开始时间排序的数组 + 隐式增强区间树（每个节点记录子树中最大的结束时间），
+回答"哪些事件与某个时间范围重叠"，不需要重新读取任何 ICS 文件。
+每个事件集合的索引持久化在集合目录中，随事件存储保存时增量更新
+"""
+
+import base64
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+# 重复事件没有固定的结束时间，在树中视为无限延续
+OPEN_END = 2 ** 62
+
+def _pack(values: array) -> str:
+    """把 64 位整数数组编码为 base64（小端序），比 JSON 数字列表解析快得多"""
+    if sys.byteorder != 'little':
+        values = array('q', values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+def _unpack(text: str) -> array:
+    values = array('q', base64.b64decode(text))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+class IntervalHit(NamedTuple):
+    """查询命中的事件：事件键、开始 / 结束时间（UTC 时间戳，重复事件的 end 为 None）和标题"""
+    key: str
+    start: int
+    end: Optional[int]
+    summary: Optional[str]
+
+class IntervalIndex:
+    """单个事件集合的时间区间索引
+
+    区间按开始时间排序存放在数组中，数组本身按 cgranges 的方式构成一棵隐式平衡二叉树：
+    第 k 层的节点下标二进制末尾恰好有 k 个 1，max_ends 记录每个节点子树中最大的结束时间。
+    查询只进入最大结束时间晚于查询开始、且开始时间早于查询结束的子树，复杂度 O(log n + 命中数)。
+
+    增删改只调整排序数组，树在下次查询或保存时重建（O(n)）；开始时间未知的事件不进入索引。
+    """
+
+    FILENAME = '.intervals.json'
+    VERSION = 1
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.keys: List[str] = []
+        self.summaries: List[Optional[str]] = []
+        self._max_ends: Optional[array] = None
+        self._max_level = -1
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[str, Optional[int], Optional[int], Optional[str]]]) -> 'IntervalIndex':
+        """由 (事件键, 开始, 结束, 标题) 构建索引，结束为 None 的事件视为重复事件"""
+
+        index = cls()
+        for key, start, end, summary in sorted(
+                (item for item in items if item[1] is not None), key=lambda item: item[1]):
+            index.starts.append(start)
+            index.ends.append(OPEN_END if end is None else end)
+            index.keys.append(key)
+            index.summaries.append(summary)
+        return index
+
+    def add(self, key: str, start: Optional[int], end: Optional[int] = None, summary: Optional[str] = None):
+        """加入一个事件（开始时间未知时忽略）"""
+
+        if start is None:
+            return
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, OPEN_END if end is None else end)
+        self.keys.insert(position, key)
+        self.summaries.insert(position, summary)
+        self._max_ends = None
+
+    def discard(self, key: str) -> bool:
+        """移除一个事件，返回事件此前是否在索引中"""
+
+        try:
+            position = self.keys.index(key)
+        except ValueError:
+            return False
+        del self.starts[position]
+        del self.ends[position]
+        del self.keys[position]
+        del self.summaries[position]
+        self._max_ends = None
+        return True
+
+    def _build_tree(self):
+        """自底向上计算每个节点子树的最大结束时间（cgranges 的 cr_index）"""
+
+        n = len(self.starts)
+        ends = self.ends
+        max_ends = array('q', ends)
+        if n == 0:
+            self._max_ends, self._max_level = max_ends, -1
+            return
+
+        # last_i 指向最右侧的节点，last 为其子树的最大结束时间（树不满时代替缺失的右子树）
+        last_i = (n - 1) & ~1
+        last = ends[last_i]
+        level = 1
+        while 1 << level <= n:
+            half = 1 << (level - 1)
+            for i in range((half << 1) - 1, n, half << 2):
+                end = ends[i]
+                left = max_ends[i - half]
+                right = max_ends[i + half] if i + half < n else last
+                if left > end:
+                    end = left
+                if right > end:
+                    end = right
+                max_ends[i] = end
+            last_i = last_i - half if (last_i >> level) & 1 else last_i + half
+            if last_i < n and max_ends[last_i] > last:
+                last = max_ends[last_i]
+            level += 1
+
+        self._max_ends, self._max_level = max_ends, level - 1
+
+    def query(self, start: int, end: int) -> List[IntervalHit]:
+        """查询与 [start, end) 重叠的事件，按开始时间排序（重复事件只要开始时间早于 end 即视为重叠）"""
+
+        if not self.keys:
+            return []
+        if self._max_ends is None:
+            self._build_tree()
+
+        n = len(self.starts)
+        starts, ends, max_ends = self.starts, self.ends, self._max_ends
+        found = []
+        # 栈中元素: (层, 节点下标, 左子树是否已处理)
+        stack = [(self._max_level, (1 << self._max_level) - 1, False)]
+        while stack:
+            level, node, left_done = stack.pop()
+            if level <= 3:
+                # 小子树直接线性扫描
+                first = node >> level << level
+                last = min(first + (1 << (level + 1)) - 1, n)
+                i = first
+                while i < last and starts[i] < end:
+                    if start < ends[i]:
+                        found.append(i)
+                    i += 1
+            elif not left_done:
+                # 左子节点下标可能越界（树不满），此时仍需进入以访问其中存在的节点
+                child = node - (1 << (level - 1))
+                stack.append((level, node, True))
+                if child >= n or max_ends[child] > start:
+                    stack.append((level - 1, child, False))
+            elif node < n and starts[node] < end:
+                if start < ends[node]:
+                    found.append(node)
+                stack.append((level - 1, node + (1 << (level - 1)), False))
+
+        found.sort()
+        return [
+            IntervalHit(self.keys[i], starts[i], None if ends[i] == OPEN_END else ends[i], self.summaries[i])
+            for i in found
+        ]
+
+    def save(self, path: str):
+        """原子写入索引文件（包括树的节点最大值，加载后无需重建）
+
+        整数数组以 base64 编码的小端 64 位整数保存，事件键和标题为 JSON 列表。
+        """
+
+        if self._max_ends is None:
+            self._build_tree()
+        content = json.dumps({
+            'version': self.VERSION,
+            'max_level': self._max_level,
+            'starts': _pack(self.starts),
+            'ends': _pack(self.ends),
+            'max_ends': _pack(self._max_ends),
+            'keys': self.keys,
+            'summaries': self.summaries
+        }, ensure_ascii=False, separators=(',', ':'))
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def is_fresh(path: str, reference: str) -> bool:
+        """索引文件存在且不早于 reference 文件（事件索引）时视为未过期"""
+
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        try:
+            return modified >= os.stat(reference).st_mtime_ns
+        except OSError:
+            return True
+
+    @classmethod
+    def load(cls, path: str, newer_than: Optional[str] = None) -> Optional['IntervalIndex']:
+        """读取索引文件；文件不存在、格式不符或早于 newer_than 指定的文件（索引已过期）时返回 None"""
+
+        if newer_than is not None and not cls.is_fresh(path, newer_than):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != cls.VERSION:
+            return None
+
+        index = cls()
+        try:
+            index.starts = _unpack(data['starts'])
+            index.ends = _unpack(data['ends'])
+            index._max_ends = _unpack(data['max_ends'])
+        except (KeyError, ValueError):
+            return None
+        index.keys = data.get('keys', [])
+        index.summaries = data.get('summaries', [])
+        index._max_level = data.get('max_level', -1)
+        if not len(index.starts) == len(index.ends) == len(index._max_ends) == len(index.keys) == len(index.summaries):
+            return None
+        return index
@@ -6,51 +6,145 @@ CalDAV 同步工具主程序
 统一进行账号信息获取与调度
 """
 
+import os
 import sys
 import argparse
-from typing import List, Optional
-from config_manager import ConfigManager, CalDAVAccount
-from sync_dingtalk import DingTalkCalDAVSync
-from sync_tencent import TencentCalDAVSync
+import glob
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+from config_manager import ConfigManager, CalDAVAccount, config_flag
+from console import buffered_output
+from event_record import format_timestamp
+from event_store import EventStore
+from ics_parser import parse_ics_timestamp
+from interval_index import IntervalHit
 from ics_merger import ICSMerger
+from providers import get_provider_types, load_provider
+
+# 传递给同步处理器的全局配置项
+HANDLER_CONFIG_KEYS = (
+    'TIMEOUT', 'CONNECT_TIMEOUT', 'HTTP_POOL_MAXSIZE',
+    'HTTP_MAX_RETRIES', 'HTTP_BACKOFF_BASE', 'HTTP_BACKOFF_MAX', 'CIRCUIT_FAILURE_THRESHOLD', 'CIRCUIT_RESET_SECONDS',
+    'CTAG_MAX_AGE_HOURS', 'DELTA_SYNC', 'MAX_EVENTS_PER_REQUEST',
+    'ADAPTIVE_POLL', 'POLL_MIN_INTERVAL', 'POLL_MAX_INTERVAL',
+    'TIERED_SYNC', 'HOT_DAYS_PAST', 'HOT_DAYS_FUTURE', 'COLD_REFRESH_HOURS',
+    'REPORT_CHUNK_DAYS', 'REPORT_MIN_CHUNK_DAYS', 'REPORT_MAX_WORKERS', 'REPORT_MAX_MB',
+    'COLLECTION_MAX_WORKERS', 'DISCOVERY_CACHE_MINUTES', 'EVENT_FILES'
+)
 
 class CalDAVSyncManager:
     """CalDAV 同步管理器"""
 
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, shard: Optional[Tuple[int, int]] = None,
+                 max_in_flight: Optional[int] = None):
         self.config_manager = ConfigManager()
-        self.sync_handlers = {
-            'dingtalk': DingTalkCalDAVSync,
-            'tencent': TencentCalDAVSync
-        }
-        self.merger = ICSMerger()
+        # 分片 (编号, 总数)：多个节点各自只同步属于自己的账号，事件写入共享存储后再统一合并
+        self.shard = shard
+        # 处理器实例按账号名称缓存复用（常驻运行时保留连接、同步状态和事件存储）
+        self.handlers = {}
+        self._handlers_lock = threading.Lock()
+        self.merger = ICSMerger(
+            parallel_threshold=int(self.config_manager.get_global_config('MERGE_PARALLEL_THRESHOLD') or 2000),
+            max_workers=int(self.config_manager.get_global_config('MERGE_MAX_WORKERS') or 0) or None,
+            event_files=config_flag(self.config_manager.get_global_config('EVENT_FILES'))
+        )
+
+        # 并发同步的线程数：命令行参数优先，其次读取 SYNC_MAX_WORKERS，默认 4
+        if max_workers is None:
+            max_workers = int(self.config_manager.get_global_config('SYNC_MAX_WORKERS') or 4)
+        self.max_workers = max(1, max_workers)
+
+        # 流水线模式的请求并发上限：命令行参数优先，其次读取 PIPELINE_MAX_IN_FLIGHT，未配置时不使用流水线
+        if max_in_flight is None:
+            max_in_flight = int(self.config_manager.get_global_config('PIPELINE_MAX_IN_FLIGHT') or 0)
+        self.max_in_flight = max(0, max_in_flight)
+        self.pipeline_workers = int(self.config_manager.get_global_config('PIPELINE_WORKERS') or 0) or None
+
+    def get_type_concurrency(self, account_type: str) -> Optional[int]:
+        """获取同一账号类型同时同步的账号数上限（{TYPE}_MAX_CONCURRENCY，未配置时不单独限制）"""
+        value = self.config_manager.get_global_config(f'{account_type.upper()}_MAX_CONCURRENCY')
+        return max(1, int(value)) if value else None
+
+    def get_accounts(self) -> List[CalDAVAccount]:
+        """获取本节点负责的账号（未分片时为所有账号）"""
+        if self.shard is None:
+            return self.config_manager.get_accounts()
+        return self.config_manager.get_shard_accounts(*self.shard)
 
     def list_accounts(self):
         """列出所有配置的账号"""
         self.config_manager.list_accounts()
 
-    def sync_account(self, account: CalDAVAccount) -> bool:
-        """同步指定账号"""
-        print(f"\n=== 开始同步账号: {account.account_name} ===")
+        if self.shard is not None:
+            shard_index, shard_count = self.shard
+            accounts = self.get_accounts()
+            print(f"=== 分片 {shard_index}/{shard_count}: {len(accounts)} 个账号 ===")
+            for account in accounts:
+                print(f"- {account.account_name} ({account.account_type})")
 
-        # 获取对应的同步处理器
-        handler_class = self.sync_handlers.get(account.account_type)
-        if not handler_class:
-            print(f"❌ 不支持的账号类型: {account.account_type}")
-            return False
+    def get_handler(self, account: CalDAVAccount):
+        """获取账号的同步处理器，首次使用时创建，不支持的账号类型返回 None"""
+
+        with self._handlers_lock:
+            if account.account_name in self.handlers:
+                return self.handlers[account.account_name]
+
+            # 首次使用时才导入处理器模块
+            handler_class = load_provider(account.account_type)
+            if not handler_class:
+                return None
 
-        try:
             # 准备特定于处理器的配置
-            handler_config = {}
-            if account.account_type == 'tencent':
-                handler_config['TENCENT_SYNC_DAYS_PAST'] = self.config_manager.get_global_config('TENCENT_SYNC_DAYS_PAST')
-                handler_config['TENCENT_SYNC_DAYS_FUTURE'] = self.config_manager.get_global_config('TENCENT_SYNC_DAYS_FUTURE')
-            elif account.account_type == 'dingtalk':
-                handler_config['DINGTALK_SYNC_DAYS_PAST'] = self.config_manager.get_global_config('DINGTALK_SYNC_DAYS_PAST')
-                handler_config['DINGTALK_SYNC_DAYS_FUTURE'] = self.config_manager.get_global_config('DINGTALK_SYNC_DAYS_FUTURE')
+            prefix = account.account_type.upper()
+            config_keys = HANDLER_CONFIG_KEYS + (f'{prefix}_SYNC_DAYS_PAST', f'{prefix}_SYNC_DAYS_FUTURE')
+            handler_config = {key: self.config_manager.get_global_config(key) for key in config_keys}
 
             # 创建同步处理器实例
-            sync_handler = handler_class(account, config=handler_config)
+            self.handlers[account.account_name] = handler_class(account, config=handler_config)
+            return self.handlers[account.account_name]
+
+    def get_next_sync_delay(self, account: CalDAVAccount) -> Optional[float]:
+        """根据账号各集合的自适应轮询间隔计算距下次同步的秒数，没有轮询记录时返回 None"""
+
+        with self._handlers_lock:
+            handler = self.handlers.get(account.account_name)
+        if handler is None or not handler.adaptive_poll:
+            return None
+
+        next_poll_at = handler.get_next_poll_at()
+        if next_poll_at is None:
+            return None
+        return max(handler.poll_min_interval, next_poll_at - time.time())
+
+    def get_open_event_stores(self) -> Dict[str, EventStore]:
+        """获取处理器中已打开的事件存储 {目录: 事件存储}，合并时直接使用其中的内存内容"""
+
+        with self._handlers_lock:
+            handlers = list(self.handlers.values())
+        return {
+            os.path.normpath(store.directory): store
+            for handler in handlers
+            for store in list(handler.event_stores.values())
+        }
+
+    def reset_event_stores(self):
+        """丢弃处理器缓存的事件存储，下次同步时重新读取（清理任务修改过索引之后调用）"""
+        with self._handlers_lock:
+            for handler in self.handlers.values():
+                handler.event_stores.clear()
+
+    def sync_account(self, account: CalDAVAccount) -> bool:
+        """同步指定账号"""
+        print(f"\n=== 开始同步账号: {account.account_name} ===")
+
+        try:
+            sync_handler = self.get_handler(account)
+            if not sync_handler:
+                print(f"❌ 不支持的账号类型: {account.account_type}")
+                return False
 
             # 执行同步
             result = sync_handler.sync()
@@ -67,34 +161,106 @@ class CalDAVSyncManager:
             return False
 
     def sync_all_accounts(self) -> int:
-        """同步所有账号"""
-        accounts = self.config_manager.get_accounts()
+        """同步所有账号（分片模式下只同步本分片的账号）"""
+        accounts = self.get_accounts()
 
         if not accounts:
             print("❌ 未找到任何配置的账号")
             return 0
 
-        print(f"找到 {len(accounts)} 个配置的账号")
+        if self.shard is not None:
+            print(f"分片 {self.shard[0]}/{self.shard[1]}: 负责 {len(accounts)}/{len(self.config_manager.get_accounts())} 个账号")
+        else:
+            print(f"找到 {len(accounts)} 个配置的账号")
 
-        success_count = 0
-        for account in accounts:
-            if self.sync_account(account):
-                success_count += 1
+        success_count = self.sync_accounts(accounts)
 
         print(f"\n=== 同步完成 ===")
         print(f"成功: {success_count}/{len(accounts)} 个账号")
 
         return success_count
 
+    def sync_accounts(self, accounts: List[CalDAVAccount]) -> int:
+        """通过有界线程池同步多个账号，返回成功的账号数
+
+        总并发不超过 max_workers，同一类型的并发不超过 {TYPE}_MAX_CONCURRENCY；
+        达到类型上限的账号留在队列中，空闲线程优先分配给其他类型，各类型轮流提交。
+        配置了请求并发上限时改用 asyncio 流水线，按集合调度所有账号。
+        """
+        if self.max_in_flight:
+            # 按需导入：流水线默认不启用，其他命令不必加载 asyncio
+            from sync_pipeline import SyncPipeline
+            return SyncPipeline(self, self.max_in_flight, self.pipeline_workers).run(accounts)
+
+        workers = min(self.max_workers, len(accounts))
+        if workers <= 1:
+            return sum(1 for account in accounts if self.sync_account(account))
+
+        # 按类型分组排队
+        pending: Dict[str, deque] = {}
+        for account in accounts:
+            pending.setdefault(account.account_type, deque()).append(account)
+        limits = {account_type: self.get_type_concurrency(account_type) for account_type in pending}
+        running = {account_type: 0 for account_type in pending}
+
+        print(f"并发同步，线程数: {workers}")
+        for account_type, limit in limits.items():
+            if limit:
+                print(f"  - {account_type} 并发上限: {limit}")
+
+        success_count = 0
+        futures = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or futures:
+                # 轮流从各类型队列中提交，直到线程用满或剩余类型都达到上限
+                submitted = True
+                while submitted and len(futures) < workers:
+                    submitted = False
+                    for account_type in list(pending):
+                        if len(futures) >= workers:
+                            break
+                        limit = limits[account_type]
+                        if limit and running[account_type] >= limit:
+                            continue
+                        account = pending[account_type].popleft()
+                        if not pending[account_type]:
+                            del pending[account_type]
+                        running[account_type] += 1
+                        futures[executor.submit(self._sync_account_buffered, account)] = account_type
+                        submitted = True
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running[futures.pop(future)] -= 1
+                    if future.result():
+                        success_count += 1
+
+        return success_count
+
+    def _sync_account_buffered(self, account: CalDAVAccount) -> bool:
+        """在工作线程中同步账号，输出整块缓冲，避免多个账号的日志交错"""
+        with buffered_output():
+            return self.sync_account(account)
+
     def sync_by_type(self, account_type: str) -> bool:
-        """根据类型同步账号"""
-        account = self.config_manager.get_account_by_type(account_type)
+        """根据类型同步该类型的所有账号，全部成功时返回 True"""
+        accounts = self.config_manager.get_accounts_by_type(account_type)
+        if self.shard is not None:
+            accounts = [account for account in accounts if account.get_shard_index(self.shard[1]) == self.shard[0]]
 
-        if not account:
+        if not accounts:
             print(f"❌ 未找到类型为 {account_type} 的账号")
             return False
 
-        return self.sync_account(account)
+        if len(accounts) == 1:
+            return self.sync_account(accounts[0])
+
+        print(f"找到 {len(accounts)} 个 {account_type} 账号")
+        success_count = self.sync_accounts(accounts)
+        print(f"\n=== {account_type} 同步完成 ===")
+        print(f"成功: {success_count}/{len(accounts)} 个账号")
+
+        return success_count == len(accounts)
 
     def sync_by_name(self, account_name: str) -> bool:
         """根据名称同步账号"""
@@ -114,7 +280,7 @@ class CalDAVSyncManager:
         try:
             # 获取自定义文件名
             custom_filename = self.config_manager.get_global_config('ICS_FILE_NAME')
-            merged_file = self.merger.merge_by_account_type(account_type, custom_filename)
+            merged_file = self.merger.merge_by_account_type(account_type, custom_filename, self.get_open_event_stores())
             if merged_file:
                 print(f"✅ {account_type} 类型合并成功: {merged_file}")
                 return True
@@ -133,7 +299,7 @@ class CalDAVSyncManager:
         try:
             # 获取自定义文件名
             custom_filename = self.config_manager.get_global_config('ICS_FILE_NAME')
-            merged_file = self.merger.merge_all_accounts(custom_filename)
+            merged_file = self.merger.merge_all_accounts(custom_filename, self.get_open_event_stores())
             if merged_file:
                 print(f"✅ 所有账号合并成功: {merged_file}")
                 return True
@@ -144,6 +310,59 @@ class CalDAVSyncManager:
             print(f"❌ 所有账号合并异常: {e}")
             return False
 
+    def merge_configured_types(self) -> Dict[str, str]:
+        """单次遍历源文件，为所有已配置的账号类型生成按类型合并文件和全局合并文件
+
+        同步处理器已打开的事件存储直接交给合并器（内存中的事件不再从磁盘读取），其余集合从事件存储索引加载。
+        返回 {账号类型或 'all': 合并文件路径}，合并失败的项不包含在结果中。
+        """
+        account_types = sorted({account.account_type for account in self.config_manager.get_accounts()})
+        custom_filename = self.config_manager.get_global_config('ICS_FILE_NAME')
+        return self.merger.merge_outputs(account_types, custom_filename, event_stores=self.get_open_event_stores())
+
+    def query_events(self, start: int, end: int, account_type: Optional[str] = None) -> List[Tuple[str, IntervalHit]]:
+        """查询与 [start, end)（UTC 时间戳）重叠的事件，返回按开始时间排序的 [(集合目录, 命中事件)]
+
+        每个集合使用持久化的时间区间索引，不读取事件索引和 ICS 文件；处理器已打开的事件存储直接使用内存中的索引。
+        account_type 为 None 时查询所有类型。
+        """
+
+        account_types = [account_type.lower()] if account_type else get_provider_types()
+        open_stores = self.get_open_event_stores()
+        results = []
+        for current_type in account_types:
+            for index_file in sorted(glob.glob(os.path.join(f"{current_type}_events_*", "*", EventStore.INDEX_FILENAME))):
+                directory = os.path.normpath(os.path.dirname(index_file))
+                if directory in open_stores:
+                    hits = open_stores[directory].query(start, end)
+                else:
+                    hits = EventStore.load_interval_index(directory).query(start, end)
+                results.extend((directory, hit) for hit in hits)
+
+        results.sort(key=lambda item: (item[1].start, item[1].key))
+        return results
+
+    def print_events_in_range(self, start: int, end: int, account_type: Optional[str] = None) -> bool:
+        """查询并输出与时间范围重叠的事件"""
+
+        if account_type and account_type.lower() not in get_provider_types():
+            print(f"❌ 不支持的账号类型: {account_type}")
+            return False
+
+        print(f"\n=== 查询事件: {format_timestamp(start)} ~ {format_timestamp(end)} (UTC)"
+              f"{f'，类型 {account_type}' if account_type else ''} ===")
+
+        started_at = time.perf_counter()
+        results = self.query_events(start, end, account_type)
+        elapsed = (time.perf_counter() - started_at) * 1000
+
+        for directory, hit in results:
+            end_text = format_timestamp(hit.end) if hit.end is not None else '重复事件'
+            print(f"  {format_timestamp(hit.start)} ~ {end_text}  {hit.summary or '无标题'}  [{directory}]")
+
+        print(f"✅ 找到 {len(results)} 个事件，耗时 {elapsed:.1f} ms")
+        return True
+
     def cleanup_temp_files(self, days: int = 7) -> bool:
         """清理临时文件"""
 
@@ -174,19 +393,17 @@ class CalDAVSyncManager:
 
             print(f"✅ 步骤1完成: {success_count} 个账号同步成功")
 
-            # 步骤2: 按类型合并ICS文件
+            # 步骤2 + 步骤3: 单次遍历源文件，同时生成按类型合并文件和全局合并文件
             print(f"\n📋 步骤2: 按类型合并ICS文件")
+            print(f"🌐 步骤3: 全局合并所有账号（与步骤2共用一次解析）")
 
             # 获取所有账号类型
-            account_types = set()
-            for account in self.config_manager.get_accounts():
-                account_types.add(account.account_type)
+            account_types = {account.account_type for account in self.config_manager.get_accounts()}
+            merge_results = self.merge_configured_types()
 
             merged_files = []
-            custom_filename = self.config_manager.get_global_config('ICS_FILE_NAME')
-            for account_type in account_types:
-                print(f"  合并 {account_type} 类型...")
-                merged_file = self.merger.merge_by_account_type(account_type, custom_filename)
+            for account_type in sorted(account_types):
+                merged_file = merge_results.get(account_type)
                 if merged_file:
                     merged_files.append(merged_file)
                     print(f"  ✅ {account_type} 合并成功: {merged_file}")
@@ -196,11 +413,7 @@ class CalDAVSyncManager:
 
             print(f"✅ 步骤2完成: 生成了 {len(merged_files)} 个按类型合并的文件")
 
-            # 步骤3: 全局合并
-            print(f"\n🌐 步骤3: 全局合并所有账号")
-            # 获取自定义文件名
-            custom_filename = self.config_manager.get_global_config('ICS_FILE_NAME')
-            global_merged_file = self.merger.merge_all_accounts(custom_filename)
+            global_merged_file = merge_results.get('all')
             if global_merged_file:
                 print(f"✅ 步骤3完成: 全局合并成功 -> {global_merged_file}")
             else:
@@ -232,6 +445,28 @@ class CalDAVSyncManager:
             print(f"❌ 工作流程执行异常: {e}")
             return False
 
+def parse_shard(value: str) -> Tuple[int, int]:
+    """解析 --shard 参数，格式为 i/N（0 <= i < N）"""
+    try:
+        shard_index, shard_count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/N，例如 0/4: {value}")
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise argparse.ArgumentTypeError(f"分片编号应满足 0 <= i < N: {value}")
+    return shard_index, shard_count
+
+def parse_query_time(value: str) -> int:
+    """解析查询时间（按 UTC）：2026-10-20、2026-10-20T10:00、"2026-10-20 10:00:00" 或 20261020T100000Z"""
+
+    compact = value.strip().replace('-', '').replace(':', '').replace(' ', 'T')
+    if 'T' in compact:
+        date_part, _, time_part = compact.partition('T')
+        compact = f"{date_part}T{time_part.rstrip('Z').ljust(6, '0')}"
+    timestamp = parse_ics_timestamp(compact)
+    if timestamp is None:
+        raise argparse.ArgumentTypeError(f"时间格式应为 YYYY-MM-DD 或 YYYY-MM-DDTHH:MM[:SS]: {value}")
+    return timestamp
+
 def create_parser():
     """创建命令行参数解析器"""
     parser = argparse.ArgumentParser(
@@ -241,6 +476,8 @@ def create_parser():
 使用示例:
   python main.py --list                    # 列出所有配置的账号
   python main.py --sync-all                # 同步所有账号
+  python main.py --sync-all --workers 8    # 使用 8 个线程并发同步所有账号
+  python main.py --sync-all --shard 0/4    # 只同步第 0 个分片（共 4 个）的账号
   python main.py --sync-type dingtalk      # 同步钉钉账号
   python main.py --sync-type tencent       # 同步腾讯会议账号
   python main.py --sync-name "钉钉日历账号"  # 根据名称同步账号
@@ -248,20 +485,31 @@ def create_parser():
   python main.py --merge-all               # 合并所有账号的ICS文件
   python main.py --cleanup                 # 清理临时文件
   python main.py --workflow                # 运行完整工作流程（同步+合并+清理）
+  python main.py --daemon                  # 常驻运行，按间隔自动同步、合并和清理
+  python main.py --query --start 2026-10-01 --end 2026-10-08              # 查询与时间范围重叠的事件
+  python main.py --query --start 2026-10-01 --end 2026-10-08 --type google
         """
     )
 
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--list', action='store_true', help='列出所有配置的账号')
     group.add_argument('--sync-all', action='store_true', help='同步所有账号')
-    group.add_argument('--sync-type', metavar='TYPE', help='根据类型同步账号 (dingtalk, tencent)')
+    group.add_argument('--sync-type', metavar='TYPE', help=f"根据类型同步账号 ({', '.join(get_provider_types())})")
     group.add_argument('--sync-name', metavar='NAME', help='根据名称同步账号')
-    group.add_argument('--merge-type', metavar='TYPE', help='按类型合并ICS文件 (dingtalk, tencent)')
+    group.add_argument('--merge-type', metavar='TYPE', help=f"按类型合并ICS文件 ({', '.join(get_provider_types())})")
     group.add_argument('--merge-all', action='store_true', help='合并所有账号的ICS文件')
     group.add_argument('--cleanup', type=int, nargs='?', const=7, metavar='DAYS', help='清理N天前的临时文件 (默认7天)')
     group.add_argument('--workflow', type=int, nargs='?', const=7, metavar='DAYS', help='运行完整工作流程：同步+合并+清理 (默认清理7天前文件)')
+    group.add_argument('--daemon', type=int, nargs='?', const=7, metavar='DAYS', help='常驻运行：按间隔同步、合并并清理N天前的临时文件 (默认7天)，收到 SIGTERM 后退出')
+    group.add_argument('--query', action='store_true', help='查询与 --start ~ --end 重叠的事件（使用时间区间索引，不读取 ICS 文件）')
 
     parser.add_argument('--config', default='.env', help='配置文件路径 (默认: .env)')
+    parser.add_argument('--workers', type=int, metavar='N', help='并发同步的线程数 (默认读取 SYNC_MAX_WORKERS，未配置时为 4)')
+    parser.add_argument('--pipeline', type=int, metavar='N', help='使用流水线同步，最多同时进行 N 个请求 (默认读取 PIPELINE_MAX_IN_FLIGHT，未配置时不使用流水线)')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N', help='只同步第 i 个分片的账号 (共 N 个分片，按账号稳定哈希划分，可与 --list/--sync-all/--sync-type 一起使用)')
+    parser.add_argument('--start', type=parse_query_time, metavar='TIME', help='查询的开始时间 (UTC，例如 2026-10-01 或 2026-10-01T09:00)')
+    parser.add_argument('--end', type=parse_query_time, metavar='TIME', help='查询的结束时间 (UTC，不含)')
+    parser.add_argument('--type', metavar='TYPE', help=f"只查询指定类型的账号 ({', '.join(get_provider_types())})")
     parser.add_argument('--verbose', '-v', action='store_true', help='详细输出')
 
     return parser
@@ -271,9 +519,17 @@ def main():
     parser = create_parser()
     args = parser.parse_args()
 
+    # 分片只用于同步；合并和清理始终面向共享存储中的全部事件
+    if args.shard and not (args.list or args.sync_all or args.sync_type):
+        parser.error("--shard 只能与 --list、--sync-all 或 --sync-type 一起使用，合并请单独运行 --merge-all")
+    if args.query and (args.start is None or args.end is None):
+        parser.error("--query 需要同时指定 --start 和 --end")
+    if not args.query and (args.start is not None or args.end is not None or args.type):
+        parser.error("--start、--end 和 --type 只能与 --query 一起使用")
+
     try:
         # 创建同步管理器
-        sync_manager = CalDAVSyncManager()
+        sync_manager = CalDAVSyncManager(max_workers=args.workers, shard=args.shard, max_in_flight=args.pipeline)
 
         if args.list:
             # 列出所有账号
@@ -314,6 +570,17 @@ def main():
             success = sync_manager.run_full_workflow(args.workflow)
             sys.exit(0 if success else 1)
 
+        elif args.daemon is not None:
+            # 常驻运行（按需导入守护进程模块）
+            from daemon import SyncDaemon
+            success = SyncDaemon(sync_manager, cleanup_days=args.daemon).run()
+            sys.exit(0 if success else 1)
+
+        elif args.query:
+            # 按时间范围查询事件
+            success = sync_manager.print_events_in_range(args.start, args.end, args.type)
+            sys.exit(0 if success else 1)
+
     except KeyboardInterrupt:
         print("\n用户中断操作")
         sys.exit(1)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+同步处理器注册表
+记录每种账号类型对应的处理器模块和类名，只在实际使用时才导入处理器模块
+"""
+
+import importlib
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+@dataclass
+class ProviderSpec:
+    """处理器注册信息"""
+    module: str
+    class_name: str
+    label: str
+
+# 账号类型 -> 处理器；没有特殊差异的服务直接使用通用 CalDAV 引擎
+PROVIDERS: Dict[str, ProviderSpec] = {
+    'dingtalk': ProviderSpec('sync_dingtalk', 'DingTalkCalDAVSync', '钉钉'),
+    'tencent': ProviderSpec('sync_tencent', 'TencentCalDAVSync', '腾讯会议'),
+    'google': ProviderSpec('caldav_sync', 'CalDAVSync', 'Google'),
+    'outlook': ProviderSpec('caldav_sync', 'CalDAVSync', 'Outlook'),
+}
+
+_loaded_classes = {}
+_lock = threading.Lock()
+
+def register_provider(account_type: str, module: str, class_name: str, label: Optional[str] = None):
+    """注册（或覆盖）账号类型对应的处理器"""
+
+    account_type = account_type.lower()
+    with _lock:
+        PROVIDERS[account_type] = ProviderSpec(module, class_name, label or account_type)
+        _loaded_classes.pop(account_type, None)
+
+def get_provider_types() -> List[str]:
+    """获取所有已注册的账号类型"""
+    return list(PROVIDERS)
+
+def get_provider_label(account_type: str) -> str:
+    """获取账号类型的显示名称"""
+
+    spec = PROVIDERS.get(account_type.lower())
+    return spec.label if spec else account_type
+
+def load_provider(account_type: str):
+    """按需导入并返回账号类型对应的处理器类，未注册时返回 None"""
+
+    account_type = account_type.lower()
+    spec = PROVIDERS.get(account_type)
+    if spec is None:
+        return None
+
+    with _lock:
+        if account_type not in _loaded_classes:
+            module = importlib.import_module(spec.module)
+            _loaded_classes[account_type] = getattr(module, spec.class_name)
+        return _loaded_classes[account_type]
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+asyncio 同步流水线
+把多个账号的同步拆成 发现集合 -> 同步集合 -> 汇总 三个阶段，通过队列衔接，
+所有处理器共享有限的请求槽，使网络请求与解析、写入事件存储相互重叠
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config_manager import CalDAVAccount
+from console import buffered_output
+
+@dataclass
+class AccountJob:
+    """流水线中一个账号的同步进度"""
+    account: CalDAVAccount
+    handler: object
+    collections: List[dict]
+    event_counts: List[Optional[int]] = field(default_factory=list)
+    remaining: int = 0
+
+class SyncPipeline:
+    """asyncio 同步流水线
+
+    生产者为每个账号发现集合，把 (账号, 集合) 放入有界队列；固定数量的消费者从队列中取出集合同步，
+    账号的最后一个集合完成后汇总并保存同步状态。处理器仍使用同步的 requests 会话，
+    在线程池中执行，asyncio 负责调度和背压：
+
+    - 所有请求共享 max_in_flight 个请求槽，同时进行的请求数不超过该值
+    - 时间范围响应先完整落盘再释放请求槽，解析和写入存储期间其他集合的请求继续进行，
+      因此消费者（线程）数默认为请求槽的两倍
+    - 同一类型同时同步的集合数不超过 {TYPE}_MAX_CONCURRENCY
+    """
+
+    def __init__(self, manager, max_in_flight: int, workers: Optional[int] = None):
+        self.manager = manager
+        self.max_in_flight = max(1, max_in_flight)
+        self.workers = max(1, workers or self.max_in_flight * 2)
+
+    def run(self, accounts: List[CalDAVAccount]) -> int:
+        """同步多个账号，返回成功的账号数"""
+
+        print(f"流水线同步: {len(accounts)} 个账号，请求并发上限 {self.max_in_flight}，工作线程 {self.workers}")
+        results = asyncio.run(self._run(accounts))
+        return sum(1 for success in results.values() if success)
+
+    async def _run(self, accounts: List[CalDAVAccount]) -> Dict[str, bool]:
+        loop = asyncio.get_running_loop()
+        request_slots = threading.BoundedSemaphore(self.max_in_flight)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        type_limits = {}
+        for account_type in {account.account_type for account in accounts}:
+            limit = self.manager.get_type_concurrency(account_type)
+            if limit:
+                type_limits[account_type] = asyncio.Semaphore(limit)
+                print(f"  - {account_type} 集合并发上限: {limit}")
+
+        results: Dict[str, bool] = {}
+        handlers = []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+            async def produce(account: CalDAVAccount):
+                handler = self.manager.get_handler(account)
+                if not handler:
+                    print(f"❌ 不支持的账号类型: {account.account_type}")
+                    results[account.account_name] = False
+                    return
+
+                handler.request_slots = request_slots
+                handler.spool_responses = True
+                handlers.append(handler)
+
+                collections = await loop.run_in_executor(executor, self._begin_account, account, handler)
+                if not collections:
+                    results[account.account_name] = False
+                    return
+
+                job = AccountJob(account, handler, collections, [None] * len(collections), len(collections))
+                for index in range(len(collections)):
+                    await queue.put((job, index))
+
+            async def consume():
+                while True:
+                    job, index = await queue.get()
+                    try:
+                        limit = type_limits.get(job.account.account_type)
+                        if limit is None:
+                            job.event_counts[index] = await loop.run_in_executor(
+                                executor, self._sync_collection, job, index)
+                        else:
+                            async with limit:
+                                job.event_counts[index] = await loop.run_in_executor(
+                                    executor, self._sync_collection, job, index)
+
+                        job.remaining -= 1
+                        if job.remaining == 0:
+                            results[job.account.account_name] = await loop.run_in_executor(
+                                executor, self._finish_account, job)
+                    finally:
+                        queue.task_done()
+
+            consumers = [asyncio.create_task(consume()) for _ in range(self.workers)]
+            try:
+                await asyncio.gather(*(produce(account) for account in accounts))
+                await queue.join()
+            finally:
+                for consumer in consumers:
+                    consumer.cancel()
+                await asyncio.gather(*consumers, return_exceptions=True)
+                # 处理器会被缓存复用，流水线结束后恢复为独立同步模式
+                for handler in handlers:
+                    handler.request_slots = None
+                    handler.spool_responses = False
+
+        return results
+
+    def _begin_account(self, account: CalDAVAccount, handler) -> list:
+        """发现账号的集合（在工作线程中执行，输出整块缓冲）"""
+
+        with buffered_output():
+            print(f"\n=== 开始同步账号: {account.account_name} ===")
+            try:
+                collections = handler.begin_sync()
+            except Exception as e:
+                print(f"❌ 同步账号 {account.account_name} 时发生异常: {e}")
+                return []
+            if not collections:
+                print(f"❌ 账号 {account.account_name} 同步失败")
+            return collections
+
+    def _sync_collection(self, job: AccountJob, index: int) -> Optional[int]:
+        """同步一个集合（在工作线程中执行，输出整块缓冲）"""
+
+        with buffered_output():
+            print(f"\n=== [{job.account.account_name}] 集合 '{job.collections[index]['name']}' ===")
+            return job.handler._sync_collection_isolated(job.collections[index])
+
+    def _finish_account(self, job: AccountJob) -> bool:
+        """账号的所有集合完成后汇总并保存同步状态"""
+
+        with buffered_output():
+            print(f"\n=== [{job.account.account_name}] 汇总 ===")
+            try:
+                success = job.handler.finish_sync(job.collections, job.event_counts)
+            except Exception as e:
+                print(f"❌ 同步账号 {job.account.account_name} 时发生异常: {e}")
+                return False
+            if success:
+                print(f"✅ 账号 {job.account.account_name} 同步成功")
+            else:
+                print(f"❌ 账号 {job.account.account_name} 同步失败")
+            return success
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+同步状态存储模块
+按账号持久化每个日历集合的 ctag / sync-token 等同步状态，用于跳过未变化的集合
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+class SyncStateStore:
+    """同步状态存储（每个账号一个 JSON 文件）"""
+
+    # 状态格式版本，格式不兼容时丢弃旧状态并重新完整同步
+    FORMAT_VERSION = 2
+
+    def __init__(self, service: str, username: str, state_dir: str = "state"):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, f"{service}_{username}.json")
+        self._lock = threading.Lock()
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        """读取状态文件，文件不存在或损坏时返回空状态"""
+
+        empty_state = {'version': self.FORMAT_VERSION, 'collections': {}}
+
+        if not os.path.exists(self.path):
+            return empty_state
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取同步状态失败 {self.path}: {e}")
+            return empty_state
+
+        if data.get('version') != self.FORMAT_VERSION:
+            print(f"同步状态格式已更新，忽略旧状态: {self.path}")
+            return empty_state
+
+        data.setdefault('collections', {})
+        return data
+
+    def get_collection(self, href: str) -> Dict:
+        """获取指定集合的状态（不存在时返回空字典）"""
+        with self._lock:
+            return dict(self.data['collections'].get(href, {}))
+
+    def get_collections(self) -> Dict[str, Dict]:
+        """获取所有集合状态的副本"""
+        with self._lock:
+            return {href: dict(state) for href, state in self.data['collections'].items()}
+
+    def update_collection(self, href: str, **values):
+        """更新指定集合的状态"""
+        with self._lock:
+            self.data['collections'].setdefault(href, {}).update(values)
+
+    def is_collection_unchanged(self, href: str, ctag: Optional[str], sync_token: Optional[str],
+                                max_age_seconds: float) -> bool:
+        """判断集合自上次完整同步后是否未发生变化
+
+        优先比较 ctag，服务器不提供 ctag 时比较 sync-token；两者都没有时视为已变化。
+        距上次完整同步超过 max_age_seconds 时也视为已变化，以便滚动时间窗口能覆盖新进入范围的事件。
+        """
+        state = self.get_collection(href)
+        if not state:
+            return False
+
+        if time.time() - state.get('synced_at', 0) > max_age_seconds:
+            return False
+
+        if ctag:
+            return state.get('ctag') == ctag
+        if sync_token:
+            return state.get('sync_token') == sync_token
+        return False
+
+    def get_discovery(self) -> Dict:
+        """获取缓存的集合发现结果（不存在时返回空字典）"""
+        with self._lock:
+            return dict(self.data.get('discovery') or {})
+
+    def set_discovery(self, collections: List[Dict], validator: Optional[Dict]):
+        """缓存集合发现结果及主目录的版本标识"""
+        with self._lock:
+            self.data['discovery'] = {
+                'collections': collections,
+                'validator': validator,
+                'discovered_at': time.time()
+            }
+
+    def renew_discovery(self):
+        """主目录校验通过后延长缓存的有效期"""
+        with self._lock:
+            if self.data.get('discovery'):
+                self.data['discovery']['discovered_at'] = time.time()
+
+    def invalidate_discovery(self):
+        """丢弃缓存的集合发现结果，下次同步时重新发现"""
+        with self._lock:
+            self.data.pop('discovery', None)
+
+    def save(self):
+        """原子写入状态文件"""
+
+        with self._lock:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
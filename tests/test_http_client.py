@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+请求重试与熔断测试
+超时后由调用方拆分时间范围的请求不计入熔断，拆分后的请求可以继续发出
+"""
+
+import os
+import re
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import requests
+from requests.exceptions import ReadTimeout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client
+from caldav_sync import CalDAVSync
+from config_manager import CalDAVAccount
+
+EVENT_TEMPLATE = (
+    "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nBEGIN:VEVENT\r\nUID:{uid}\r\nSUMMARY:{uid}\r\n"
+    "DTSTART:{start}\r\nDTEND:{start}\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+)
+
+class FakeSession:
+    """时间范围超过 max_days 天的 calendar-query 超时，其余请求返回范围起点处的一个事件"""
+
+    def __init__(self, max_days: float):
+        self.max_days = max_days
+        self.requests = 0
+
+    def request(self, method, url, data=None, **kwargs):
+        self.requests += 1
+        match = re.search(r'start="(\w+)" end="(\w+)"', data or '')
+        if match is None:
+            raise ReadTimeout('timed out')
+        start, end = (datetime.strptime(value, '%Y%m%dT%H%M%SZ') for value in match.groups())
+        if end - start > timedelta(days=self.max_days):
+            raise ReadTimeout('Read timed out.')
+
+        calendar_data = EVENT_TEMPLATE.format(uid=f"event-{match.group(1)}", start=match.group(1))
+        body = (
+            '<?xml version="1.0"?><D:multistatus xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">'
+            f'<D:response><D:href>{url}{match.group(1)}.ics</D:href><D:propstat><D:prop>'
+            f'<D:getetag>"1"</D:getetag><C:calendar-data>{calendar_data}</C:calendar-data>'
+            '</D:prop><D:status>HTTP/1.1 200 OK</D:status></D:propstat></D:response></D:multistatus>'
+        )
+        response = requests.Response()
+        response.status_code = 207
+        response._content = body.encode('utf-8')
+        response._content_consumed = True
+        return response
+
+class SplitOnTimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.original_cwd = os.getcwd()
+        self.workdir = tempfile.TemporaryDirectory()
+        os.chdir(self.workdir.name)
+        http_client._breakers.clear()
+
+    def tearDown(self):
+        os.chdir(self.original_cwd)
+        self.workdir.cleanup()
+        http_client._breakers.clear()
+
+    def test_timeout_handled_by_caller_is_not_a_breaker_failure(self):
+        breaker = http_client.CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+        session = FakeSession(max_days=10)
+
+        for _ in range(5):
+            with self.assertRaises(ReadTimeout):
+                http_client.request_with_retry(session, 'REPORT', 'http://example.invalid/', breaker=breaker,
+                                               retry_on_timeout=False)
+        self.assertFalse(breaker.is_open)
+        self.assertEqual(breaker.failures, 0)
+
+    def test_fetch_time_range_splits_with_breaker_enabled(self):
+        account = CalDAVAccount('google', 'test', 'user', 'password', 'http://example.invalid/{username}/')
+        handler = CalDAVSync(account, {'CIRCUIT_FAILURE_THRESHOLD': 2, 'REPORT_MIN_CHUNK_DAYS': 1})
+        handler.session = FakeSession(max_days=10)
+        collection = {'name': '测试', 'collection': 'test', 'href': 'http://example.invalid/user/test/',
+                      'ctag': None, 'sync_token': None}
+
+        start = datetime(2026, 1, 1)
+        events = handler.fetch_time_range(collection, start, start + timedelta(days=80), '0')
+
+        # 80 天 -> 40 -> 20 -> 10 天，共 8 个分段，超时的 7 个请求都不计入熔断
+        self.assertIsNotNone(events)
+        self.assertEqual(len(events), 8)
+        self.assertEqual(handler.session.requests, 15)
+        self.assertFalse(handler.breaker.is_open)
+
+if __name__ == '__main__':
+    unittest.main()